@@ -1,12 +1,240 @@
 import math
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 ##
 from gmpy2 import kronecker, gcdext
 from math import isqrt, gcd
 ##
-from sympy.solvers.diophantine.diophantine import diop_DN
 from sympy.utilities.misc import as_int
+from sympy.ntheory.factor_ import factorint, multiplicity
+from sympy.ntheory.generate import nextprime, primerange
 from sympy.ntheory.residue_ntheory import sqrt_mod
+from sympy.matrices import Matrix
+from sympy.matrices.normalforms import invariant_factors
+from sympy.polys.domains import ZZ
+from sympy.external import import_module
+
+numpy = import_module('numpy')
+
+
+def _smallest_prime_factors(n):
+    """ ``0 <= m < n`` の最小素因数の表 (``m < 2`` では 0) と、``n`` 未満の素数の配列を返す
+    """
+    spf = numpy.zeros(n, dtype=numpy.int32)
+    for p in range(2, isqrt(n - 1) + 1):
+        if spf[p] == 0:
+            s = spf[p * p::p]
+            s[s == 0] = p
+    primes = numpy.flatnonzero(spf[2:] == 0) + 2
+    spf[primes] = primes
+    return spf, primes
+
+
+def _inverse_mod(x, m):
+    """ ``x`` の ``m`` を法とする逆元を要素ごとに求める (``gcd(x, m) = 1`` を仮定する)
+    """
+    r0, r1 = m, x % m
+    s0, s1 = numpy.zeros_like(m), numpy.ones_like(m)
+    while r1.any():
+        nz = r1 != 0
+        q = r0 // numpy.where(nz, r1, 1)
+        r0, r1 = numpy.where(nz, r1, r0), numpy.where(nz, r0 - q * r1, r1)
+        s0, s1 = numpy.where(nz, s1, s0), numpy.where(nz, s0 - q * s1, s1)
+    return s0 % m
+
+
+def _product_indices(n1, n2):
+    """ 各 ``k`` と ``0 <= i < n1[k]``, ``0 <= j < n2[k]`` のすべての組 ``(k, i, j)`` を、3つの配列で返す
+    """
+    n = n1 * n2
+    k = numpy.repeat(numpy.arange(len(n)), n)
+    j = numpy.arange(n.sum()) - numpy.repeat(numpy.cumsum(n) - n, n)
+    return k, j // n2[k], j % n2[k]
+
+
+def _reduced_forms(disc):
+    r""" 判別式 ``disc`` (負) の原始的な簡約形式 ``(a, b, c)`` を、``(a, b)`` の昇順に
+    形 ``(h, 3)`` の ``numpy.int64`` の配列として返す。
+
+    `b^2 \equiv D \pmod{4a}` の解 `b \bmod 2a` は、`a = 2^e o` (`o` は奇数) について
+    `\bmod 2^{e+1}` の解と `\bmod o` の解を中国剰余定理で組み合わせたものである。
+    `\bmod o` の解は `o` について乗法的なので、素数冪 `q` での解だけを ``sqrt_mod`` で求め、
+    最小素因数の冪 `q` と `o = q m` について `m` の解と組み合わせて、`o` の小さい順に作る。
+    """
+    A = isqrt(-disc // 3)
+    spf, primes = _smallest_prime_factors(A + 1)
+    # 奇数 o の解を start[o] から count[o] 個並べる
+    start = numpy.zeros(A + 1, dtype=numpy.int64)
+    count = numpy.zeros(A + 1, dtype=numpy.int64)
+    count[1] = 1
+    values = [0]
+    for p in primes[1:].tolist():
+        k = kronecker(disc, p)
+        if k == -1:
+            continue
+        q = p
+        while q <= A:
+            if q == p and k == 1:
+                r = sqrt_mod(disc, p)
+                roots = [r, p - r]
+            else:
+                roots = sqrt_mod(disc, q, all_roots=True)
+            start[q], count[q] = len(values), len(roots)
+            values.extend(roots)
+            q *= p
+    values = numpy.array(values, dtype=numpy.int64)
+    # [lo, 2lo) の素数冪でない奇数 o = q m は、m, q <= o/3 < lo
+    lo = 3
+    while lo <= A:
+        o = numpy.arange(lo | 1, min(2 * lo, A + 1), 2)
+        p = spf[o].astype(numpy.int64)
+        q = p.copy()
+        while True:
+            more = o // q % p == 0
+            if not more.any():
+                break
+            q[more] *= p[more]
+        m = o // q
+        keep = (m != 1) & (count[m] != 0) & (count[q] != 0)
+        o, q, m = o[keep], q[keep], m[keep]
+        k, i, j = _product_indices(count[m], count[q])
+        u, t = values[start[m][k] + i], values[start[q][k] + j]
+        inv = _inverse_mod(m % q, q)[k]
+        start[o] = len(values) + numpy.cumsum(count[m] * count[q]) - count[m] * count[q]
+        count[o] = count[m] * count[q]
+        values = numpy.concatenate([values, u + m[k] * ((t - u) % q[k] * inv % q[k])])
+        lo *= 2
+    forms = []
+    e = 0
+    while 1 << e <= A:
+        Q = 1 << (e + 1)
+        ts = numpy.unique(numpy.array(sqrt_mod(disc, 2 * Q, all_roots=True), dtype=numpy.int64) % Q)
+        if len(ts) == 0:
+            break
+        o = numpy.arange(1, (A >> e) + 1, 2)
+        o = o[count[o] != 0]
+        k, i, j = _product_indices(count[o], numpy.full_like(o, len(ts)))
+        u, t = values[start[o][k] + i], ts[j]
+        a = o[k] << e
+        b = u + o[k] * ((t - u) % Q * _inverse_mod(o % Q, numpy.full_like(o, Q))[k] % Q)
+        b = numpy.where(a < b, b - 2 * a, b)
+        c = (b * b - disc) // (4 * a)
+        keep = (a <= c) & ((a != c) | (0 <= b)) & (numpy.gcd(numpy.gcd(a, b), c) == 1)
+        forms.append(numpy.stack([a[keep], b[keep], c[keep]], axis=1))
+        e += 1
+    if not forms:
+        return numpy.zeros((0, 3), dtype=numpy.int64)
+    forms = numpy.concatenate(forms)
+    return forms[numpy.lexsort((forms[:, 1], forms[:, 0]))]
+
+
+class KroneckerTableCache:
+    r""" 判別式 ``disc`` ごとの指標 `\chi_D(n) = \left(\frac{D}{n}\right)` (``0 <= n < |D|``) の表のキャッシュ
+
+    `\chi_D` は周期 `|D|` を持つので、1周期分を ``numpy.int8`` の配列として持つ。
+    表の合計が ``limit`` バイトを超えないように、最も古く使われた表から捨てる。
+    ``numpy`` がない場合や、1つの表が ``limit`` バイトを超える場合は ``None`` を返す。
+    表は長さ ``_SEGMENT`` ずつ作るので、作る途中で表のほかに使うメモリは `O(\sqrt{|D|})` と
+    ``_SEGMENT`` に比例する分だけである。
+    素数での値を ``numpy.int64`` で求めるため、``limit`` は `2^{31}` 以下とする。
+
+    表を作るのは :meth:`QuadraticFormClassGroup.counting_order` より遅い
+    (`|D| = 10^6` で約 0.09 秒に対して約 4 ミリ秒) が、一度作った表での類数公式の和は
+    `|D| = 10^6` で約 0.3 ミリ秒、`|D| = 10^7` で約 3 ミリ秒で済む。
+    そこで :func:`class_number_of_quadratic_field` は、``|D| <= 1000`` のほか、
+    ``|D| <= _NEG_TABLE_MAX`` で表がキャッシュにある判別式にも類数公式を用いる。
+    同じ判別式の類数を何度も求める場合は、先に ``kronecker_tables[disc]`` で表を作っておけばよい。
+
+    Examples
+    ========
+
+    >>> from ****
+    >>> kronecker_tables = KroneckerTableCache(limit=1 << 20)
+    >>> kronecker_tables[-23][:8]
+    array([ 0,  1,  1,  1,  1, -1,  1, -1], dtype=int8)
+
+    """
+
+    # 表を作るときに一度に埋める長さ
+    _SEGMENT = 1 << 20
+
+    def __init__(self, limit=1 << 26):
+        if not 0 <= limit <= 1 << 31:
+            raise ValueError("limit は 0 以上 2**31 以下にしてください")
+        self.limit = limit
+        self._tables = OrderedDict()
+        self._nbytes = 0
+
+    def clear(self):
+        """ キャッシュを空にする
+        """
+        self._tables.clear()
+        self._nbytes = 0
+
+    def __contains__(self, disc):
+        return disc in self._tables
+
+    def __getitem__(self, disc):
+        if disc in self._tables:
+            self._tables.move_to_end(disc)
+            return self._tables[disc]
+        if numpy is None or self.limit < abs(disc):
+            return None
+        table = self._build(disc)
+        table.flags.writeable = False
+        self._tables[disc] = table
+        self._nbytes += table.nbytes
+        while self.limit < self._nbytes:
+            _, old = self._tables.popitem(last=False)
+            self._nbytes -= old.nbytes
+        return table
+
+    def _build(self, disc):
+        r""" `\chi_D` は `n` について完全乗法的なので、素数 `p` での値だけを求め、
+        最小素因数 `p` を用いて `\chi_D(n) = \chi_D(p) \chi_D(n/p)` で埋める。
+        最小素因数は `\sqrt{|D|}` 以下の素数で区間ごとに篩って求める。
+        """
+        n = abs(disc)
+        chi = numpy.zeros(n, dtype=numpy.int8)
+        if n == 1:
+            return chi
+        chi[1] = 1
+        if n <= 2:
+            return chi
+        chi[2] = kronecker(disc, 2)
+        base_primes = _smallest_prime_factors(isqrt(n - 1) + 1)[1].tolist()
+        # [lo, hi) の m は hi <= 2 lo なので m / spf[m] < lo
+        lo = 3
+        while lo < n:
+            hi = min(2 * lo, lo + self._SEGMENT, n)
+            spf = numpy.zeros(hi - lo, dtype=numpy.int64)
+            for p in reversed(base_primes):
+                start = max(p * p, -(-lo // p) * p)
+                if start < hi:
+                    spf[start - lo::p] = p
+            m = numpy.arange(lo, hi, dtype=numpy.int64)
+            # 奇素数 p では Euler の規準 D^{(p-1)/2} mod p (p < 2^31 なので積は int64 に収まる)
+            p = m[(spf == 0) & (m % 2 == 1)]
+            base = disc % p
+            e = (p - 1) // 2
+            r = numpy.ones_like(p)
+            while e.any():
+                r = numpy.where(e & 1, r * base % p, r)
+                base = base * base % p
+                e >>= 1
+            chi[p] = numpy.where(r == 1, 1, numpy.where(r == 0, 0, -1))
+            composite = spf != 0
+            q, m = spf[composite], m[composite]
+            chi[m] = chi[q] * chi[m // q]
+            lo = hi
+        return chi
+
+
+kronecker_tables = KroneckerTableCache()
+# キャッシュした表による類数公式が counting_order より速い |D| の上限
+_NEG_TABLE_MAX = 10**7
 
 
 def _class_number_neg_naive(disc):
@@ -20,16 +248,152 @@ def _class_number_neg_naive(disc):
     .. [1] ****
 
     """
-    h = sum(kronecker(disc, n) for n in range(1, abs(disc) // 2 + 1))
+    chi = kronecker_tables[disc]
+    if chi is None:
+        h = sum(kronecker(disc, n) for n in range(1, abs(disc) // 2 + 1))
+    else:
+        h = int(chi[1:abs(disc) // 2 + 1].sum(dtype=numpy.int64))
     if disc % 8 == 5:
         h //= 3
     elif disc % 4 == 0:
         h //= 2
     return int(h)
 
+
+def _class_number_neg_estimate(disc, P):
+    r""" 類数公式 `h = \frac{\sqrt{|D|}}{\pi} L(1, \chi_D)` の `L(1, \chi_D)` を
+    `p \le P` で打ち切ったオイラー積で近似して、類数の推定値を返す。
+    ``disc`` は ``-4`` より小さい判別式とする。
+
+    References
+    ==========
+
+    .. [1] Henri Cohen, A Course in Computational Algebraic Number Theory,
+           Springer, 1993, Section 5.4
+
+    """
+    log_l = -sum(math.log1p(-kronecker(disc, p) / p) for p in primerange(2, P + 1))
+    return math.sqrt(-disc) / math.pi * math.exp(log_l)
+
+
+def _smooth_multiples(e, lo, hi):
+    """ ``lo <= e*k <= hi`` かつ ``k`` の素因数がすべて ``e`` を割り切るような ``e*k`` を列挙する
+    """
+    ps = list(factorint(e))
+    def _rec(k, i):
+        if hi < e * k:
+            return
+        if lo <= e * k:
+            yield e * k
+        for j in range(i, len(ps)):
+            yield from _rec(k * ps[j], j)
+    return sorted(_rec(1, 0))
+
+def _wnaf(n, w):
+    """ ``n`` (非負) の幅 ``w`` の NAF 表現を下の桁から返す。
+    各桁は 0 か、絶対値が `2^{w-1}` 未満の奇数で、0 でない桁の間には少なくとも ``w-1`` 個の 0 が入る。
+    """
+    digits = []
+    while n:
+        if n % 2:
+            d = n % (1 << w)
+            if 1 << (w - 1) <= d:
+                d -= 1 << w
+            n -= d
+        else:
+            d = 0
+        digits.append(d)
+        n >>= 1
+    return digits
+
+
+class FormPowers:
+    r""" 固定した形式 `f` の冪 `f^n` を計算するための前計算表
+
+    `f^{d 2^i}` (``d`` は `2^{w-1}` 未満の正の奇数) を ``i`` ごとに保持し、
+    ``n`` の幅 ``w`` の NAF 表現 `n = \sum_i d_i 2^i` から `f^n = \prod_i f^{d_i 2^i}` を求める。
+    逆元は ``(a, -b, c)`` で得られるので、負の桁も表から引ける。
+    表ができていれば、1回の冪乗は約 ``n.bit_length() / (w + 1)`` 回の合成で済む。
+    表は必要になった ``i`` まで順に作り、``max_bits`` 行を超える分は保持しない。
+    ``window`` は 2 以上とする。
+
+    Examples
+    ========
+
+    >>> from ****
+    >>> qf = QuadraticFormClassGroup(-83)
+    >>> powers = FormPowers(qf, 3, 1, 7)
+    >>> powers.pow(2), powers.pow(3)
+    ((3, -1, 7), (1, 1, 21))
+
+    """
+
+    def __init__(self, group, a, b, c, window=2, max_bits=None):
+        if window < 2:
+            raise ValueError("window は 2 以上にしてください")
+        self.group = group
+        self.window = window
+        self.max_bits = max_bits if max_bits is not None else abs(group.disc).bit_length()
+        # f, f^3, ..., f^{2^{w-1}-1}
+        row = [(a, b, c)]
+        if 2 < window:
+            f2 = group.composition_double(a, b, c)
+            for _ in range((1 << (window - 2)) - 1):
+                row.append(group.composition(*row[-1], *f2))
+        self._rows = [row]
+
+    def _double(self, row):
+        return [self.group.composition_double(*f) for f in row]
+
+    def pow(self, n):
+        """ `f^n` を返す。``n`` は負でもよい。
+        """
+        group = self.group
+        if n < 0:
+            a, b, c = self.pow(-n)
+            return group.reduction(a, -b, c)
+        result = None
+        row = self._rows[0]
+        for i, d in enumerate(_wnaf(n, self.window)):
+            if i:
+                if i < len(self._rows):
+                    row = self._rows[i]
+                else:
+                    row = self._double(row)
+                    if len(self._rows) < self.max_bits:
+                        self._rows.append(row)
+            if d == 0:
+                continue
+            a, b, c = row[abs(d) // 2]
+            if d < 0:
+                a, b, c = group.reduction(a, -b, c)
+            result = (a, b, c) if result is None else group.composition(*result, a, b, c)
+        return group.identity() if result is None else result
+
+
 class QuadraticFormClassGroup:
-    def __init__(self, disc):
+    r""" 判別式 ``disc`` (負) の原始的な正定値2次形式の類群
+
+    ``nucomp=True`` とすると、合成 (:meth:`composition`, :meth:`composition_double`) に
+    Shanks の NUCOMP/NUDUPL を用いる。部分的な拡張ユークリッドの互除法により、
+    途中の係数を `|D|^{1/2}` 程度に抑えるので、判別式が大きいときに速い。
+
+    :meth:`n_times` は底ごとの前計算表 :class:`FormPowers` を、最近使った ``cache_size`` 個まで保持する。
+    同じ形式の冪を何度も計算するときは、2回目以降は合成の回数しかかからない。
+    ``window`` は表の幅 (w-NAF の ``w``) で、2 以上とする。
+    ``cache_size=0`` のときは表を作らず、2進法で冪を計算する。
+
+    """
+    def __init__(self, disc, nucomp=False, window=2, cache_size=32):
+        if window < 2:
+            raise ValueError("window は 2 以上にしてください")
         self.disc = disc
+        self.nucomp = nucomp
+        # NUCOMP/NUDUPL の部分ユークリッドの打ち切り `|D/4|^{1/4}`
+        self._L = isqrt(isqrt(-disc // 4)) if disc < 0 else 0
+        self.window = window
+        self.cache_size = cache_size
+        self._powers = OrderedDict()
 
     def reduction(self, a, b, c):
         """ 簡約形式を返す
@@ -50,6 +414,8 @@ class QuadraticFormClassGroup:
     def composition(self, a1, b1, c1, a2, b2, c2):
         """ 合成
         """
+        if self.nucomp:
+            return self._nucomp(a1, b1, c1, a2, b2, c2)
         h, _, v = gcdext(a1, a2)
         g, u, w = gcdext(h, (b1 + b2) // 2)
         a3 = (a1 * a2) // g**2
@@ -58,6 +424,8 @@ class QuadraticFormClassGroup:
         return self.reduction(a3, b3, c3)
 
     def composition_double(self, a, b, c):
+        if self.nucomp:
+            return self._nudupl(a, b, c)
         g, _, w = gcdext(a, b)
         k = a // g
         a_ = k**2
@@ -65,9 +433,138 @@ class QuadraticFormClassGroup:
         c_ = (b_**2 - self.disc) // (4 * a_)
         return self.reduction(a_, b_, c_)
 
+    def _partial_euclid(self, d, v3):
+        """ ``|v3| <= L`` となるまで ``d, v3`` に互除法を施し、
+        ``(z, d, v3, v, v2)`` を返す。``z`` はステップ数、``v, v2`` は ``v3`` の係数。
+        """
+        v, v2 = 0, 1
+        z = 0
+        while self._L < abs(v3):
+            t3 = d % abs(v3)
+            t2 = v - (d - t3) // v3 * v2
+            v, d, v2, v3 = v2, v3, t2, t3
+            z += 1
+        return z, d, v3, v, v2
+
+    def _nucomp(self, a1, b1, c1, a2, b2, c2):
+        """ NUCOMP による合成
+
+        References
+        ==========
+
+        .. [1] Michael J. Jacobson Jr., Alfred J. van der Poorten,
+               Computational aspects of NUCOMP, ANTS-V, LNCS 2369 (2002), pp. 120-133
+        .. [2] Henri Cohen, A Course in Computational Algebraic Number Theory,
+               Springer, 1993, Algorithm 5.4.9
+
+        """
+        s = (b1 + b2) // 2
+        n = b2 - s
+        d, u, v = gcdext(a2, a1)
+        d1 = 1
+        if s % d == 0:
+            a = -u * n
+            d1 = d
+            a1 //= d1
+            a2 //= d1
+            s //= d1
+        else:
+            d1, u1, _ = gcdext(s, d)
+            a1 //= d1
+            a2 //= d1
+            s //= d1
+            d //= d1
+            l = -u1 * (u * (c1 % d) + v * (c2 % d)) % d
+            a = l * (a1 // d) - u * (n // d)
+        a %= a1
+        if a1 < 2 * a:
+            a -= a1
+        z, d, v3, v, v2 = self._partial_euclid(a1, a)
+        if z == 0:
+            g = (v3 * s + c2) // d
+            b = a2
+            v2 = d1
+            A = d * b
+        else:
+            if z % 2:
+                v3, v2 = -v3, -v2
+            b = (a2 * d + n * v) // a1
+            e = (s * d + c2 * v) // a1
+            q3 = e * v2
+            q4 = q3 - s
+            b2 = q3 + q4
+            g = q4 // v
+            v2 *= d1
+            v *= d1
+            b2 *= d1
+            A = d * b + e * v
+        q1 = b * v3
+        q2 = q1 + n
+        B = b2 + (q1 + q2 if z else 2 * q1)
+        C = v3 * (q2 // d) + g * v2
+        return self.reduction(A, B, C)
+
+    def _nudupl(self, a, b, c):
+        """ NUDUPL による2乗
+
+        References
+        ==========
+
+        .. [1] Michael J. Jacobson Jr., Alfred J. van der Poorten,
+               Computational aspects of NUCOMP, ANTS-V, LNCS 2369 (2002), pp. 120-133
+        .. [2] Henri Cohen, A Course in Computational Algebraic Number Theory,
+               Springer, 1993, Algorithm 5.4.8
+
+        """
+        b0 = b
+        d1, u, _ = gcdext(b, a)
+        a //= d1
+        b //= d1
+        k = -u * c % a
+        if a < 2 * k:
+            k -= a
+        z, d, v3, v, v2 = self._partial_euclid(a, k)
+        a2 = d * d
+        c2 = v3 * v3
+        if z == 0:
+            g = (v3 * b + c) // d
+            b2 = b0
+            v2 = d1
+            A = a2
+        else:
+            if z % 2:
+                v, d = -v, -d
+            e = (c * v + b * d) // a
+            g = (e * v2 - b) // v
+            b2 = (e * v2 + v * g) * d1
+            v *= d1
+            v2 *= d1
+            A = a2 + e * v
+        B = b2 + (d + v3)**2 - a2 - c2
+        C = c2 + g * v2
+        return self.reduction(A, B, C)
+
+    def powers(self, a, b, c):
+        """ 形式 ``(a, b, c)`` の前計算表 :class:`FormPowers` を返す
+        """
+        key = a, b, c
+        if key in self._powers:
+            self._powers.move_to_end(key)
+            return self._powers[key]
+        powers = self._powers[key] = FormPowers(self, a, b, c, self.window)
+        if self.cache_size < len(self._powers):
+            self._powers.popitem(last=False)
+        return powers
+
     def n_times(self, a, b, c, n):
-        ra, rb, rc = a, b, c
-        n -= 1
+        """ ``(a, b, c)`` の ``n`` 乗
+        """
+        if self.cache_size:
+            return self.powers(a, b, c).pow(n)
+        if n < 0:
+            a, b, c = self.reduction(a, -b, c)
+            n = -n
+        ra, rb, rc = self.identity()
         while 0 < n:
             if n % 2 == 1:
                 ra, rb, rc = self.composition(ra, rb, rc, a, b, c)
@@ -75,17 +572,52 @@ class QuadraticFormClassGroup:
             n >>= 1
         return ra, rb, rc
 
-    def enumerate_elements(self):
-        """ 枚挙
+    def enumerate_elements(self, as_array=False):
+        """ 原始的な簡約形式の枚挙
+
+        ``(a, b, c)`` のリストを ``(a, b)`` の昇順に返す。
+        ``numpy`` があり、``|D|`` が ``2^{62}`` 未満の場合は :func:`_reduced_forms` で求める。
+        ``as_array=True`` とすると、同じ順に並べた形 ``(h, 3)`` の ``numpy.int64`` の配列をそのまま返す。
+        タプルのリストの約7分の1のメモリで済むので、`|D|` が大きいときはこちらを用いるとよい。
+
+        Raises
+        ======
+
+        ValueError
+            ``as_array=True`` で、``numpy`` がないか ``|D|`` が ``2^{62}`` 以上の場合
+
+        Examples
+        ========
+
+        >>> qf = QuadraticFormClassGroup(-20)
+        >>> qf.enumerate_elements()
+        [(1, 0, 5), (2, 2, 3)]
+        >>> qf.enumerate_elements(as_array=True)
+        array([[1, 0, 5],
+               [2, 2, 3]])
+
         """
+        if numpy is not None and -self.disc < 1 << 62:
+            forms = _reduced_forms(self.disc)
+            return forms if as_array else [tuple(f) for f in forms.tolist()]
+        if as_array:
+            raise ValueError("as_array=True には numpy と 2**62 未満の |disc| が必要です")
+        forms = []
         for a in range(1, isqrt(-self.disc // 3) + 1):
             for b in filter(lambda x: x <= a, sqrt_mod(self.disc, 4 * a, all_roots=True)):
                 c = (b**2 - self.disc) // (4 * a)
                 if c < a or gcd(a, b, c) != 1:
                     continue
-                yield a, b, c
+                forms.append((a, b, c))
                 if a != b and a != c and b != 0:
-                    yield a, -b, c
+                    forms.append((a, -b, c))
+        return sorted(forms)
+
+    def identity(self):
+        """ 単位元
+        """
+        odd = self.disc % 2
+        return 1, odd, (odd - self.disc) // 4
 
     def is_identity(self, a, b, c):
         if a != 1:
@@ -94,59 +626,368 @@ class QuadraticFormClassGroup:
         return b == odd and 4 * c == odd - self.disc
 
     def counting_naive(self):
-        return sum(1 for _ in self.enumerate_elements())
-
-    # def get_order(self, a, b, c):
-    #     odd = self.disc % 2
-    #     dic = {(1, odd, odd - self.disc): 0, (a, abs(b), c): 1}
-    #     ra, rb, rc = self.composition_double(a, b, c)
-    #     for k in range(2, 100):
-    #         rb_abs = abs(rb)
-    #         if (ra, rb_abs, rc) in dic:
-    #             pass
-    #         dic[(ra, rb_abs, rc)] = k
-    #         ra, rb, rc = self.composition(ra, rb, rc, a, b, c)
-
-    # def counting_order(self):
-    #     cnt = 0
-    #     odd = self.disc % 2
-    #     identity = (1, odd, odd - self.disc)
-    #     upper = 2 * abs(self.disc) // 3
-    #     m = 1
-    #     for a, b, c in self.enumerate_elements():
-    #         cnt += 1
-    #         if b < 0 or self.is_identity(a, b, c):
-    #             continue
-    #         if m > 1:
-    #             a, b, c = self.n_times(a, b, c, m)
-    #             if self.is_identity(a, b, c):
-    #                 continue
-    #         self.get_order(a, b, c)
-    #     return cnt
-
-
-
-def _class_number_pos_naive(disc):
+        if numpy is not None and -self.disc < 1 << 62:
+            return len(_reduced_forms(self.disc))
+        return len(self.enumerate_elements())
+
+    def _prime_forms(self):
+        r""" `\left(\frac{D}{p}\right) = 1` となる素数 ``p`` について、
+        素形式 ``(p, b, c)`` の簡約形式を ``p`` の小さい順に返す
+        """
+        disc = self.disc
+        if disc % 8 == 1:
+            yield self.reduction(2, 1, (1 - disc) // 8)
+        p = 2
+        while True:
+            p = nextprime(p)
+            if kronecker(disc, p) != 1:
+                continue
+            b = sqrt_mod(disc, p)
+            if (b - disc) % 2:
+                b = p - b
+            yield self.reduction(p, b, (b**2 - disc) // (4 * p))
+
+    def _bsgs(self, a, b, c, lo, hi):
+        """ ``lo <= t <= hi`` かつ ``(a, b, c)`` の ``t`` 乗が単位元となる ``t`` を
+        baby-step giant-step で探す。見つからなければ ``None`` を返す。
+        """
+        q = isqrt(hi - lo) + 1
+        baby = {}
+        g = self.identity()
+        for r in range(q):
+            # 位数が q より小さい場合は、最大の r を残す
+            baby[g] = r
+            g = self.composition(*g, a, b, c)
+        t0 = lo + q - 1
+        z = self.n_times(a, b, c, t0)
+        for t in range(t0, hi + q, q):
+            if z in baby:
+                t -= baby[z]
+                return t if t <= hi else None
+            z = self.composition(*z, *g)
+        return None
+
+    def _order(self, a, b, c, m):
+        """ ``(a, b, c)`` の ``m`` 乗が単位元であるとき、``(a, b, c)`` の位数を返す
+        """
+        for p, e in factorint(m).items():
+            for _ in range(e):
+                if not self.is_identity(*self.n_times(a, b, c, m // p)):
+                    break
+                m //= p
+        return m
+
+    def _sylow_order(self, ell, e, forms, limit):
+        """ 類群の指数を ``e`` として、``ell``-Sylow 部分群の位数を返す。
+        ``forms`` から得た元の像で部分群を生成し、新しい元が連続して得られなくなったら打ち切る。
+        位数が ``limit`` を超えた場合も打ち切る。
+        """
+        while e % ell == 0:
+            e //= ell
+        elements = {self.identity()}
+        hits = 0
+        while hits < 20 and len(elements) <= limit:
+            y = self.n_times(*next(forms), e)
+            if y in elements:
+                hits += 1
+                continue
+            hits = 0
+            powers = [self.identity(), y]
+            while (z := self.composition(*powers[-1], *y)) not in elements:
+                powers.append(z)
+            elements = {self.composition(*s, *w) for s in elements for w in powers}
+        return len(elements)
+
+    def counting_order(self):
+        r""" 類数を Shanks の baby-step giant-step で計算する。
+
+        打ち切ったオイラー積による類数の推定値 `\tilde{h}` から、類数を含む区間
+        `[\tilde{h} e^{-\delta}, \tilde{h} e^{\delta}]` を定める。
+        素形式の位数を baby-step giant-step で求め、その最小公倍数 ``e`` の倍数が区間に
+        一つしかなくなれば、それが類数である。
+        類群が巡回群から遠く、``e`` の倍数が一つに絞れない場合は、
+        類数の素因数が ``e`` の素因数に限られることと、Sylow 部分群の位数を用いて絞り込む。
+        計算量はおよそ `O(|D|^{1/4})` である。
+
+        References
+        ==========
+
+        .. [1] Henri Cohen, A Course in Computational Algebraic Number Theory,
+               Springer, 1993, Algorithm 5.4.10
+
+        """
+        disc = self.disc
+        if -4 <= disc:
+            return 1
+        log_d = math.log(-disc)
+        P = min(1 << 16, max(100, isqrt(-disc)))
+        hs = _class_number_neg_estimate(disc, P)
+        delta = max(0.5, 2 * log_d / math.sqrt(P))
+        forms = self._prime_forms()
+        e = 1
+        stable = 0
+        sylow = {}
+        while True:
+            lo = max(1, math.floor(hs * math.exp(-delta)))
+            hi = math.ceil(hs * math.exp(delta))
+            count = hi // e - (lo - 1) // e
+            if count == 1:
+                return int(hi // e * e)
+            if count == 0:
+                delta *= 2
+                continue
+            if stable < 20:
+                g = self.n_times(*next(forms), e)
+                if self.is_identity(*g):
+                    stable += 1
+                    continue
+                stable = 0
+                t = self._bsgs(*g, -(-lo // e), hi // e)
+                if t is None:
+                    delta *= 2
+                    continue
+                e *= self._order(*g, t)
+                continue
+            # e は指数と見なせるので、類数の素因数は e の素因数に限られる
+            cands = _smooth_multiples(e, lo, hi)
+            for ell in factorint(e):
+                if len(cands) <= 1:
+                    break
+                if len({multiplicity(ell, m) for m in cands}) == 1:
+                    continue
+                limit = max(ell**multiplicity(ell, m) for m in cands)
+                if ell not in sylow:
+                    order = self._sylow_order(ell, e, forms, limit)
+                    if limit < order:
+                        cands = []
+                        break
+                    sylow[ell] = order
+                cands = [m for m in cands if ell**multiplicity(ell, m) == sylow[ell]]
+            if len(cands) == 1:
+                return int(cands[0])
+            stable = 0
+            delta *= 2
+
+    def _subgroup_log(self, a, b, c, g, e, reps):
+        r""" ``g`` (位数 ``e``) と ``reps`` の形式 ``s`` で `H = \bigcup_s \langle g \rangle s` とする。
+        ``(a, b, c)`` が `g^t s` と表せるとき ``(t, x)`` を、`H` に含まれなければ ``None`` を返す。
+        ``reps`` は ``(s, x)`` のリストで、``x`` は ``s`` に付随する任意の値である。
+        baby-step giant-step で、表の大きさと計算量はいずれも `O(\sqrt{|H|})` である。
+        """
+        q = isqrt(e // len(reps)) + 1
+        table = {}
+        gr = self.identity()
+        for r in range(q):
+            for s, x in reps:
+                table.setdefault(self.composition(*gr, *s), (r, x))
+            gr = self.composition(*gr, *g)
+        # gr = g^q
+        step = self.reduction(gr[0], -gr[1], gr[2])
+        z = a, b, c
+        for t in range(0, e, q):
+            if z in table:
+                r, x = table[z]
+                return (t + r) % e, x
+            z = self.composition(*z, *step)
+        return None
+
+    def structure(self):
+        r""" 類群の構造 `\mathbb{Z}/n_1 \times \mathbb{Z}/n_2 \times \cdots` を求め、
+        `n_1 | n_2 | \cdots` のリストを返す。類群が自明であれば空リストを返す。
+
+        類数 `h` を :meth:`counting_order` で求めたのち、素形式の位数を合わせて位数の大きい元 `g` を作る。
+        続いて素形式 `q_j` を順に加え、`q_j^{m_j}` がそれまでに生成された部分群に入る最小の `m_j` と、
+        その表示 `q_j^{m_j} = g^{a} \prod_{i<j} q_i^{x_i}` を baby-step giant-step で求める。
+        部分群の位数が `h` に達したら、得られた関係の格子をスミス標準形に簡約する。
+
+        Examples
+        ========
+
+        >>> from ****
+        >>> QuadraticFormClassGroup(-3299).structure()
+        [3, 9]
+        >>> QuadraticFormClassGroup(-420).structure()
+        [2, 2, 2]
+
+        References
+        ==========
+
+        .. [1] Henri Cohen, A Course in Computational Algebraic Number Theory,
+               Springer, 1993, Section 5.4.3
+
+        """
+        h = self.counting_order()
+        if h == 1:
+            return []
+        # 位数 e の元 g
+        g, e = self.identity(), 1
+        stable = 0
+        for x in self._prime_forms():
+            if e == h or 10 <= stable:
+                break
+            if self.is_identity(*self.n_times(*x, e)):
+                stable += 1
+                continue
+            stable = 0
+            o = self._order(*x, h)
+            y = self.identity()
+            for p, k in factorint(e * o // gcd(e, o)).items():
+                # 各素数 p について、p-部分が大きい方の元から位数 p^k の元を取り出す
+                if multiplicity(p, e) == k:
+                    y = self.composition(*y, *self.n_times(*g, e // p**k))
+                else:
+                    y = self.composition(*y, *self.n_times(*x, o // p**k))
+            g, e = y, e * o // gcd(e, o)
+        if e == h:
+            return [h]
+        # reps : <g> の剰余類の代表 prod q_i^{x_i} と x
+        reps = [(self.identity(), ())]
+        rels = [[e]]
+        for q in self._prime_forms():
+            if e * len(reps) == h:
+                break
+            n = h // (e * len(reps))
+            # q^m が部分群に入る最小の m は n の約数
+            for m in (k for k in range(1, n + 1) if n % k == 0):
+                ret = self._subgroup_log(*self.n_times(*q, m), g, e, reps)
+                if ret is not None:
+                    break
+            if m == 1:
+                continue
+            t, x = ret
+            rels = [row + [0] for row in rels]
+            rels.append([-t] + [-xi for xi in x] + [m])
+            qi = self.identity()
+            new_reps = []
+            for i in range(m):
+                new_reps.extend((self.composition(*s, *qi), x + (i,)) for s, x in reps)
+                qi = self.composition(*qi, *q)
+            reps = new_reps
+        factors = invariant_factors(Matrix(rels), domain=ZZ)
+        return [int(f) for f in factors if f != 1]
+
+
+def _regulator(disc):
+    r""" 判別式 ``disc`` (正、平方数でない) の整環の単数基準 `R = \log \varepsilon` と、
+    連分数展開の周期の長さを返す。
+
+    `\theta_0 = (P_0 + \sqrt{D})/2` (`P_0` は `\sqrt{D}` 以下で `D` と偶奇が等しい最大の整数)
+    の連分数展開は純周期的で、1周期分の完全商 `\theta_i = (P_i + \sqrt{D})/Q_i` の積が
+    基本単数 `\varepsilon` になる。`P_i, Q_i` は整数演算で求め、対数の和だけを浮動小数で計算する。
+
+    References
+    ==========
+
+    .. [1] Henri Cohen, A Course in Computational Algebraic Number Theory,
+           Springer, 1993, Section 5.7
+
+    """
+    s = isqrt(disc)
+    sqrt_d = math.sqrt(disc)
+    P0 = P = s if (s - disc) % 2 == 0 else s - 1
+    Q0 = Q = 2
+    logs = []
+    while True:
+        logs.append(math.log((P + sqrt_d) / Q))
+        P = (P + s) // Q * Q - P
+        Q = (disc - P * P) // Q
+        if P == P0 and Q == Q0:
+            return math.fsum(logs), len(logs)
+
+
+def _e1(x):
+    r""" 指数積分 `E_1(x) = \int_x^\infty \frac{e^{-t}}{t} dt` (`x > 0`)
+    """
+    if x <= 1:
+        # E_1(x) = -\gamma - \log x - \sum_{k=1}^\infty (-x)^k / (k k!)
+        term, total, k = -1.0, 0.0, 1
+        while True:
+            term *= -x / k
+            total += term / k
+            if abs(term) < 1e-17:
+                break
+            k += 1
+        return -0.5772156649015329 - math.log(x) + total
+    # 連分数展開 (modified Lentz)
+    b = x + 1
+    c = 1e300
+    d = 1 / b
+    h = d
+    i = 1
+    while True:
+        an = -i * i
+        b += 2
+        d = 1 / (an * d + b)
+        c = b + an / c
+        h *= c * d
+        if abs(c * d - 1) < 1e-16:
+            return h * math.exp(-x)
+        i += 1
+
+
+def _class_number_pos(disc):
     r""" class number of quadratic field `\mathbb{Q}(\sqrt{d})`.
     ``disc`` は `\mathbb{Q}(\sqrt{d})` の判別式とし、正であることを仮定する。
 
+    単数基準 `R` は連分数展開から求め (:func:`_regulator`)、`hR` は急速に収束する級数
+
+    .. math ::
+        hR = \frac{1}{2} \sum_{n=1}^\infty \left( \frac{D}{n} \right)
+        \left( \frac{\sqrt{D}}{n} \mathrm{erfc}\left( n \sqrt{\frac{\pi}{D}} \right)
+        + E_1\left( \frac{\pi n^2}{D} \right) \right)
+
+    を `\pi n^2 / D \ge 40` まで足して求める。
+    この級数は指標が原始的であることを用いるので、`D = D_0 f^2` (`D_0` は基本判別式) のときは
+    `D_0` について求めた `h(D_0) R(D_0)` に `f \prod_{p | f} (1 - \chi_{D_0}(p)/p)` を掛ける。
+    打ち切り誤差と丸め誤差を上から評価し、`hR/R` を含む区間に整数が一つだけあることを確かめる。
+    計算量は `O(\sqrt{D})` 程度である。
+
+    Raises
+    ======
+
+    ArithmeticError
+        誤差の評価が大きく、類数が一つに定まらない場合
+
     References
     ==========
 
-    .. [1] ****
+    .. [1] Henri Cohen, A Course in Computational Algebraic Number Theory,
+           Springer, 1993, Proposition 5.6.9
 
     """
-    x, y = sorted((x, y) for x, y in diop_DN(disc, 4) + diop_DN(disc, -4) if 0 < y and 0 < x)[0]
-    # 基本単数
-    eps_0 = (x + y * math.sqrt(disc)) / 2
-    h = 1
-    for a in range(1, disc):
-        k = kronecker(disc, a)
-        if k == 1:
-            h /= math.sin(a * math.pi / disc)
-        elif k == -1:
-            h *= math.sin(a * math.pi / disc)
-    return round(math.log(h, eps_0) / 2)
+    R, period = _regulator(disc)
+    # disc = disc0 * f^2
+    disc0, f = disc, 1
+    for p, e in factorint(disc).items():
+        if p != 2:
+            disc0 //= p**(e - e % 2)
+            f *= p**(e // 2)
+    while disc0 % 4 == 0 and (disc0 // 4) % 4 in (0, 1):
+        disc0 //= 4
+        f *= 2
+    X = 40
+    sqrt_d = math.sqrt(disc0)
+    c = math.sqrt(math.pi / disc0)
+    terms = []
+    for n in range(1, isqrt(X * disc0 // 3) + 2):
+        k = kronecker(disc0, n)
+        if k:
+            terms.append(k * (sqrt_d / n * math.erfc(n * c) + _e1(math.pi * n * n / disc0)))
+    hR = math.fsum(terms) / 2
+    # 打ち切り誤差: n > N の各項は (2/X) e^{-\pi n^2/D} 以下
+    tail = 2 / X * math.exp(-X) / -math.expm1(-2 * math.sqrt(math.pi * X / disc0))
+    # erfc, E_1, log の相対誤差を 1e-14 以下と見積もる
+    hR_err = tail + 1e-14 * math.fsum(map(abs, terms))
+    if 1 < f:
+        scale = f * math.prod(1 - kronecker(disc0, p) / p for p in factorint(f))
+        hR *= scale
+        hR_err = hR_err * scale + 1e-15 * hR
+    R_err = 1e-14 * R + period * 1e-16 * R
+    h_lo = math.ceil((hR - hR_err) / (R + R_err))
+    h_hi = math.floor((hR + hR_err) / (R - R_err))
+    if h_lo != h_hi:
+        raise ArithmeticError("類数を一つに定められません")
+    return h_lo
 
 
 def class_number_of_quadratic_field(*, d=None, disc=None):
@@ -223,32 +1064,143 @@ def class_number_of_quadratic_field(*, d=None, disc=None):
         # 虚2次体
         if -4 <= disc:
             return 1
-        if -1000 <= disc:
+        if -1000 <= disc or (-disc <= _NEG_TABLE_MAX and disc in kronecker_tables):
             return _class_number_neg_naive(disc)
-        return QuadraticFormClassGroup(disc).counting_naive()
+        return QuadraticFormClassGroup(disc).counting_order()
     else:
         # 実2次体
-        if 30_000 < disc:
-            raise ValueError("大きすぎなので計算できません")
-        return _class_number_pos_naive(disc)
+        return _class_number_pos(disc)
 
 
+def _class_number_cost(disc):
+    """ ``class_number_of_quadratic_field(disc=disc)`` の計算量の大まかな見積もり
+    """
+    if disc < 0:
+        if -1000 <= disc:
+            # _class_number_neg_naive
+            return -disc
+        if -disc <= _NEG_TABLE_MAX and disc in kronecker_tables:
+            # キャッシュした表による _class_number_neg_naive
+            return -disc // 1000
+        # counting_order
+        return isqrt(isqrt(-disc)) * disc.bit_length()
+    # _class_number_pos
+    return isqrt(disc) * disc.bit_length()
 
-# import time
-# time_sta = time.time()
-# for _ in range(100):
-#     len(QuadraticFormClassGroup(-800))
-# time_end = time.time()
 
-# print(time_end- time_sta)
+def _class_numbers_chunk(chunk):
+    return [(i, class_number_of_quadratic_field(disc=disc)) for i, disc in chunk]
 
 
-# time_sta = time.time()
-# for _ in range(100):
-#     _class_number_neg_naive(-800)
-# time_end = time.time()
+def class_numbers_of_quadratic_fields(discs, processes=None, ordered=True):
+    r""" 判別式 ``discs`` のそれぞれについて ``(disc, h)`` を返すジェネレータ。
+    ``h`` は ``class_number_of_quadratic_field(disc=disc)`` と同じである。
+
+    判別式を計算量の見積もり (単純な類数公式、2次形式、解析的な公式のどれを使うか) の大きい順に並べ、
+    見積もりの合計がほぼ等しくなるようにまとめて、``processes`` 個のプロセスに配る。
+    ``ordered=True`` なら ``discs`` の順に、``False`` なら計算が終わった順に返す。
+    ``processes=1`` のときはプロセスを使わずに順に計算する。
+
+    Examples
+    ========
+
+    >>> from ****
+    >>> list(class_numbers_of_quadratic_fields([-23, 229, -3299, 5], processes=2))
+    [(-23, 3), (229, 3), (-3299, 27), (5, 1)]
+
+    """
+    discs = [as_int(disc) for disc in discs]
+    if 0 in discs:
+        raise ValueError("disc は 0 でない整数にしてください")
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 1 or len(discs) <= 1:
+        for disc in discs:
+            yield disc, class_number_of_quadratic_field(disc=disc)
+        return
+    costs = [_class_number_cost(disc) for disc in discs]
+    # 1プロセスあたり 8 個程度のまとまりに分ける
+    target = sum(costs) / (8 * processes)
+    chunks, chunk, total = [], [], 0
+    for i in sorted(range(len(discs)), key=costs.__getitem__, reverse=True):
+        chunk.append((i, discs[i]))
+        total += costs[i]
+        if target <= total:
+            chunks.append(chunk)
+            chunk, total = [], 0
+    if chunk:
+        chunks.append(chunk)
+    executor = ProcessPoolExecutor(min(processes, len(chunks)))
+    try:
+        futures = [executor.submit(_class_numbers_chunk, chunk) for chunk in chunks]
+        results = {}
+        k = 0
+        for future in as_completed(futures):
+            for i, h in future.result():
+                if ordered:
+                    results[i] = h
+                else:
+                    yield discs[i], h
+            while k in results:
+                yield discs[k], results.pop(k)
+                k += 1
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def class_numbers_range(dmin, dmax, block=1 << 16):
+    r""" ``dmin <= disc <= dmax`` を満たすすべての負の判別式 ``disc`` について、
+    ``(disc, h)`` を `|disc|` の小さい順に返すジェネレータ。
+    ``h`` は判別式 ``disc`` の原始的な簡約形式の個数であり、
+    ``disc`` が基本判別式であれば `\mathbb{Q}(\sqrt{disc})` の類数に一致する。
+
+    簡約形式 ``(a, b, c)`` を ``a, b, c`` についてループして、判別式ごとに数え上げる。
+    `|disc|` を ``block`` 個ずつに区切って処理するので、使用するメモリは ``block`` に比例する。
+    `N = -dmin` として、全体の計算量は `O(N^{3/2})` である。
+
+    Examples
+    ========
+
+    >>> from ****
+    >>> list(class_numbers_range(-24, -3))
+    [(-3, 1), (-4, 1), (-7, 1), (-8, 1), (-11, 1), (-12, 1), (-15, 2), (-16, 1), (-19, 1), (-20, 2), (-23, 3), (-24, 2)]
+
+    """
+    dmin, dmax = as_int(dmin), as_int(dmax)
+    if not dmin <= dmax < 0:
+        raise ValueError("dmin <= dmax < 0 を満たす必要があります")
+    block = max(block, isqrt(-dmin))
+    for lo in range(-dmax, -dmin + 1, block):
+        hi = min(lo + block - 1, -dmin)
+        cnt = [0] * (hi - lo + 1)
+        for a in range(1, isqrt(hi // 3) + 1):
+            a4 = 4 * a
+            for b in range(a + 1):
+                bb = b * b
+                c0 = max(a, -(-(lo + bb) // a4))
+                c1 = (hi + bb) // a4
+                if c1 < c0:
+                    continue
+                g = gcd(a, b)
+                if c0 == a and 0 < b < a:
+                    # c == a のときは b >= 0 のみ
+                    if g == 1:
+                        cnt[a4 * a - bb - lo] += 1
+                    c0 += 1
+                # 0 < b < a なら (a, -b, c) も簡約形式
+                w = 2 if 0 < b < a else 1
+                if g == 1:
+                    for i in range(a4 * c0 - bb - lo, a4 * c1 - bb - lo + 1, a4):
+                        cnt[i] += w
+                else:
+                    for c in range(c0, c1 + 1):
+                        if gcd(g, c) == 1:
+                            cnt[a4 * c - bb - lo] += w
+        for i, h in enumerate(cnt, lo):
+            if i % 4 in (0, 3):
+                yield -i, h
+
 
-# print(time_end- time_sta)
 
 # qf = QuadraticFormClassGroup(-800)
 # for a,b,c in qf.enumerate_elements():
@@ -261,5 +1213,3 @@ def class_number_of_quadratic_field(*, d=None, disc=None):
 # qf = QuadraticFormClassGroup(-63)
 # for k in range(1, 5):
 #     print(k, qf.n_times(2, 1, 8, k))
-
-print(_class_number_neg_naive(-27))
\ No newline at end of file
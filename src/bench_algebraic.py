@@ -0,0 +1,298 @@
+""" algebraic_ntheory のベンチマーク
+
+    python bench_algebraic.py                         # すべて実行して表を表示する
+    python bench_algebraic.py --json result.json      # 結果を JSON で保存する
+    python bench_algebraic.py --only counting_order --decades 10-15
+    python bench_algebraic.py --compare base.json     # base.json より遅くなったものを報告する
+
+判別式の大きさは `10^2` から `10^{15}` までの各桁 (decade) で測る。
+各ベンチマークには実用的に測れる桁の上限があり、それを超える桁は飛ばす。
+``n_times`` については、判別式のビット数 (256 から 2048) ごとのベンチマークもある。
+
+JSON の ``results`` の各要素は
+``{"benchmark": 名前, "param": "decade" か "bits", "value": 桁かビット数, "disc": 判別式, "seconds": 1回あたりの秒数, "number": 回数}``
+である。``--compare`` では ``(benchmark, param, value)`` が同じものどうしの比を表示し、
+``--threshold`` 倍を超えて遅くなったものがあれば終了コード 1 を返す。
+``class_number_of_quadratic_field`` の閾値 (``-1000`` など) は、同じ桁での
+``neg_naive``, ``counting_naive``, ``counting_order`` などの比較から選ぶ。
+
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import timeit
+
+from gmpy2 import kronecker
+from sympy.ntheory.factor_ import factorint
+from sympy.ntheory.generate import nextprime
+from sympy.ntheory.residue_ntheory import sqrt_mod
+
+from algebraic_ntheory import (QuadraticFormClassGroup, class_numbers_range, kronecker_tables,
+                               _class_number_neg_naive, _class_number_pos)
+
+
+def _random_disc(bits, rng):
+    """ ``bits`` ビットの負の判別式 (``disc % 4 == 1``)
+    """
+    disc = -(rng.getrandbits(bits) | (1 << (bits - 1)))
+    return disc - disc % 4 + 1
+
+
+def _fundamental_disc(k, sign):
+    """ `10^k` 以上で最小の `|D|` を持つ、符号 ``sign`` の基本判別式 ``D`` (``D % 4 == 1``)
+    """
+    n = 10**k
+    while True:
+        disc = sign * n
+        if disc % 4 == 1 and all(e == 1 for e in factorint(n).values()):
+            return disc
+        n += 1
+
+
+def _unreduced_form(qf):
+    """ 判別式 ``qf.disc`` の、`a` が `|D|` 程度の簡約されていない形式
+    """
+    disc = qf.disc
+    p = -disc
+    while True:
+        p = nextprime(p)
+        if kronecker(disc, p) == 1:
+            b = sqrt_mod(disc, p)
+            if (b - disc) % 2:
+                b = p - b
+            return p, b, (b**2 - disc) // (4 * p)
+
+
+def _forms(qf, count=2):
+    forms = qf._prime_forms()
+    return [next(forms) for _ in range(count)]
+
+
+# 判別式を引数とするベンチマーク
+# 名前 : (符号, 測る桁の上限, 判別式から計測する関数を作る関数)
+def _setup_reduction(disc):
+    qf = QuadraticFormClassGroup(disc)
+    f = _unreduced_form(qf)
+    return lambda: qf.reduction(*f)
+
+
+def _setup_composition(nucomp):
+    def setup(disc):
+        qf = QuadraticFormClassGroup(disc, nucomp=nucomp)
+        f, g = _forms(qf)
+        # 簡約形式どうしの合成ではなく、一般の元どうしの合成を測る
+        f = qf.n_times(*f, 12345)
+        g = qf.n_times(*g, 54321)
+        return lambda: qf.composition(*f, *g)
+    return setup
+
+
+def _setup_composition_double(nucomp):
+    def setup(disc):
+        qf = QuadraticFormClassGroup(disc, nucomp=nucomp)
+        f = qf.n_times(*_forms(qf, 1)[0], 12345)
+        return lambda: qf.composition_double(*f)
+    return setup
+
+
+def _setup_n_times(nucomp, cache_size):
+    def setup(disc):
+        qf = QuadraticFormClassGroup(disc, nucomp=nucomp, cache_size=cache_size)
+        f = _forms(qf, 1)[0]
+        n = math.isqrt(-disc)
+        return lambda: qf.n_times(*f, n)
+    return setup
+
+
+def _setup_enumerate_elements(disc):
+    qf = QuadraticFormClassGroup(disc)
+    return qf.counting_naive
+
+
+def _setup_neg_naive(disc):
+    def run():
+        # 指標の表を作るところから測る
+        kronecker_tables.clear()
+        return _class_number_neg_naive(disc)
+    return run
+
+
+def _setup_counting_order(disc):
+    return lambda: QuadraticFormClassGroup(disc).counting_order()
+
+
+def _setup_structure(disc):
+    return lambda: QuadraticFormClassGroup(disc).structure()
+
+
+def _setup_class_numbers_range(disc):
+    # |D| が |disc| から始まる 1000 個の区間 (1判別式あたりの時間は seconds / 1000)
+    return lambda: sum(1 for _ in class_numbers_range(disc - 999, disc))
+
+
+def _setup_pos(disc):
+    return lambda: _class_number_pos(disc)
+
+
+DISC_BENCHMARKS = {
+    "reduction": (-1, 15, _setup_reduction),
+    "composition": (-1, 15, _setup_composition(False)),
+    "composition_nucomp": (-1, 15, _setup_composition(True)),
+    "composition_double": (-1, 15, _setup_composition_double(False)),
+    "composition_double_nucomp": (-1, 15, _setup_composition_double(True)),
+    "n_times": (-1, 15, _setup_n_times(False, 0)),
+    "n_times_nucomp": (-1, 15, _setup_n_times(True, 0)),
+    "n_times_cached": (-1, 15, _setup_n_times(False, 32)),
+    "counting_naive": (-1, 12, _setup_enumerate_elements),
+    "neg_naive": (-1, 7, _setup_neg_naive),
+    "counting_order": (-1, 15, _setup_counting_order),
+    "structure": (-1, 15, _setup_structure),
+    "class_numbers_range": (-1, 7, _setup_class_numbers_range),
+    "pos": (1, 10, _setup_pos),
+}
+
+
+# 判別式のビット数を引数とするベンチマーク
+def _setup_n_times_bits(nucomp, cache_size, window=2):
+    def setup(disc):
+        qf = QuadraticFormClassGroup(disc, nucomp=nucomp, window=window, cache_size=cache_size)
+        f = _forms(qf, 1)[0]
+        n = random.Random(disc).getrandbits(disc.bit_length() // 2)
+        return lambda: qf.n_times(*f, n)
+    return setup
+
+
+BITS_BENCHMARKS = {
+    "n_times_bits": _setup_n_times_bits(False, 0),
+    "n_times_bits_nucomp": _setup_n_times_bits(True, 0),
+    "n_times_bits_cached": _setup_n_times_bits(True, 32),
+    "n_times_bits_cached_w4": _setup_n_times_bits(True, 32, window=4),
+}
+
+
+def _measure(fn, min_time=0.2, repeat=3):
+    """ ``fn`` の1回あたりの時間 (秒) と1回の計測での呼び出し回数を返す。
+    ``min_time`` 秒以上かかる回数を選び、``repeat`` 回のうち最小の値を採る。
+    1回で1秒以上かかるものは繰り返さない。
+    """
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    number = max(1, math.ceil(number * min_time / max(elapsed, 1e-9)))
+    if 1 < elapsed / number * repeat:
+        repeat = 1
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number, number
+
+
+def run(only=None, decades=range(2, 16), bits_list=(256, 512, 1024, 2048), seed=1234, log=None):
+    """ ベンチマークを実行し、結果の辞書を順に返す
+    """
+    for name, (sign, max_decade, setup) in DISC_BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        for k in decades:
+            if max_decade < k:
+                continue
+            disc = _fundamental_disc(k, sign)
+            seconds, number = _measure(setup(disc))
+            result = {"benchmark": name, "param": "decade", "value": k, "disc": disc,
+                      "seconds": seconds, "number": number}
+            if log:
+                log(result)
+            yield result
+    rng = random.Random(seed)
+    discs = {bits: _random_disc(bits, rng) for bits in bits_list}
+    for name, setup in BITS_BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        for bits, disc in discs.items():
+            seconds, number = _measure(setup(disc))
+            result = {"benchmark": name, "param": "bits", "value": bits, "disc": disc,
+                      "seconds": seconds, "number": number}
+            if log:
+                log(result)
+            yield result
+
+
+def compare(results, baseline, threshold=1.5):
+    """ ``baseline`` の結果と比べて、``(benchmark, param, value, 比)`` を返す。
+    比が ``threshold`` を超えたものの数も返す。
+    """
+    base = {(r["benchmark"], r["param"], r["value"]): r["seconds"] for r in baseline["results"]}
+    rows = []
+    slower = 0
+    for r in results:
+        key = r["benchmark"], r["param"], r["value"]
+        if key not in base:
+            continue
+        ratio = r["seconds"] / base[key]
+        slower += threshold < ratio
+        rows.append((*key, ratio))
+    return rows, slower
+
+
+def _metadata():
+    import gmpy2
+    import sympy
+    from algebraic_ntheory import numpy
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "sympy": sympy.__version__,
+        "gmpy2": gmpy2.version(),
+        "numpy": numpy.__version__ if numpy is not None else None,
+    }
+
+
+def _parse_range(text):
+    lo, _, hi = text.partition("-")
+    return range(int(lo), int(hi or lo) + 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--json", help="結果を JSON で保存するファイル ('-' なら標準出力)")
+    parser.add_argument("--only", help="実行するベンチマーク名 (カンマ区切り)")
+    parser.add_argument("--decades", default="2-15", help="判別式の桁の範囲 (例: 2-15)")
+    parser.add_argument("--bits", default="256,512,1024,2048", help="n_times_bits* のビット数 (カンマ区切り)")
+    parser.add_argument("--compare", help="比較する過去の結果の JSON")
+    parser.add_argument("--threshold", type=float, default=1.5, help="遅くなったとみなす比")
+    parser.add_argument("--list", action="store_true", help="ベンチマーク名を表示して終了する")
+    args = parser.parse_args(argv)
+    if args.list:
+        print("\n".join([*DISC_BENCHMARKS, *BITS_BENCHMARKS]))
+        return 0
+    only = set(args.only.split(",")) if args.only else None
+
+    def log(r):
+        print(f"{r['benchmark']:28s} {r['param']:6s} {r['value']:5d}  {r['seconds']:.3e} s",
+              file=sys.stderr, flush=True)
+
+    bits_list = [int(b) for b in args.bits.split(",") if b]
+    results = list(run(only, _parse_range(args.decades), bits_list, log=log))
+    data = {"metadata": _metadata(), "results": results}
+    if args.json == "-":
+        json.dump(data, sys.stdout, indent=1)
+        print()
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(data, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, slower = compare(results, baseline, args.threshold)
+        for name, param, value, ratio in rows:
+            mark = "  SLOWER" if args.threshold < ratio else ""
+            print(f"{name:28s} {param:6s} {value:5d}  {ratio:6.2f}{mark}", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+def _mont_add(X1, Z1, X2, Z2, Xd, Zd, n):
+    """ x-only sum of the points ``(X1 : Z1)`` and ``(X2 : Z2)`` of a
+    Montgomery curve, whose difference is ``(Xd : Zd)``
+    """
+    u = (X1 - Z1) * (X2 + Z2)
+    v = (X1 + Z1) * (X2 - Z2)
+    return Zd * (u + v)**2 % n, Xd * (u - v)**2 % n
+
+
+def _mont_double(X, Z, a24, n):
+    """ x-only double of the point ``(X : Z)`` of the Montgomery curve
+    ``y**2 = x**3 + A*x**2 + x`` with ``a24 = (A + 2)/4``
+    """
+    s = (X + Z)**2
+    d = (X - Z)**2
+    t = s - d
+    return s * d % n, t * (d + a24 * t) % n
+
+
+def _mont_ladder(k, X, Z, a24, n):
+    """ x-only ``k`` times the point ``(X : Z)`` (``k > 0``) by the Montgomery ladder
+    """
+    X0, Z0 = X, Z
+    X1, Z1 = _mont_double(X, Z, a24, n)
+    for bit in bin(k)[3:]:
+        if bit == '1':
+            X0, Z0 = _mont_add(X1, Z1, X0, Z0, X, Z, n)
+            X1, Z1 = _mont_double(X1, Z1, a24, n)
+        else:
+            X1, Z1 = _mont_add(X1, Z1, X0, Z0, X, Z, n)
+            X0, Z0 = _mont_double(X0, Z0, a24, n)
+    return X0, Z0
+
+
+def _suyama(n, sigma):
+    """ Return ``(X, Z, a24)``, the starting point and the curve of Suyama's
+    parametrisation for ``sigma``, whose order modulo every prime factor of
+    ``n`` is a multiple of 12. If the curve cannot be set up modulo ``n``,
+    return ``(g, None, None)`` with ``g`` the divisor of ``n`` that prevents it.
+    """
+    u = (sigma * sigma - 5) % n
+    v = 4 * sigma % n
+    X, Z = pow(u, 3, n), pow(v, 3, n)
+    den = 16 * X * v % n
+    g = gcd(den, n)
+    if g != 1:
+        return g, None, None
+    return X, Z, pow(v - u, 3, n) * (3 * u + v) * pow(den, -1, n) % n
+
+
+def _ecm_curve(n, sigma, B1, B2):
+    """ Run one curve of ECM with Suyama's parameter ``sigma`` and return
+    a divisor of ``n``: a nontrivial one, or ``1`` or ``n`` on failure.
+
+    Stage 1 multiplies the starting point by ``lcm(1..B1)``, cached by
+    ``_pm1_exponent``. Stage 2 is the baby-step giant-step stage 2 of
+    ``pollard_pm1`` on the points: ``x(kDQ) = x(jQ)`` if and only if
+    ``(kD + j)Q`` or ``(kD - j)Q`` is the identity, so that one
+    multiplication covers a pair of primes.
+
+    The primes ``q < D/2`` of the block ``k = 0`` (if ``B1 < D/2``) are baby
+    steps themselves: ``qQ`` is the identity exactly when the ``Z`` of the
+    baby step is zero, which the gcd of their product already detects.
+    """
+    X, Z, a24 = _suyama(n, sigma)
+    if a24 is None:
+        return X
+
+    X, Z = _mont_ladder(_pm1_exponent(B1), X, Z, a24, n)
+    g = gcd(Z, n)
+    if g != 1 or B2 <= B1:
+        return g
+
+    D = _stage2_D(B1, B2)
+    # baby steps jQ for odd j < D/2, with (j + 2)Q = jQ + 2Q and (-Q) = Q on x
+    Q2 = _mont_double(X, Z, a24, n)
+    baby = {}
+    prev = cur = (X, Z)
+    for j in range(1, D // 2, 2):
+        if gcd(j, D) == 1:
+            baby[j] = cur
+        prev, cur = cur, _mont_add(*cur, *Q2, *prev, n)
+    # normalise the baby steps to Z = 1 with a single inversion
+    js = list(baby)
+    prods = [1]
+    for j in js:
+        prods.append(prods[-1] * baby[j][1] % n)
+    g = gcd(prods[-1], n)
+    if g != 1:
+        return g
+    inv = pow(prods[-1], -1, n)
+    xs = {}
+    for i in range(len(js) - 1, -1, -1):
+        Xj, Zj = baby[js[i]]
+        xs[js[i]] = Xj * inv * prods[i] % n
+        inv = inv * Zj % n
+    # giant steps kDQ, with (k + 1)DQ = kDQ + DQ
+    G = _mont_ladder(D, X, Z, a24, n)
+    M = 1
+    k = None
+    for count, (qk, js) in enumerate(_stage2_pairs(B1, B2, D), 1):
+        if qk == 0:
+            # covered by the baby steps, and the ladder cannot compute 0 * DQ
+            continue
+        if k is None:
+            K0 = _mont_ladder(qk, *G, a24, n)
+            K1 = _mont_ladder(qk + 1, *G, a24, n)
+        else:
+            for _ in range(qk - k):
+                K0, K1 = K1, _mont_add(*K1, *G, *K0, n)
+        k = qk
+        Xk, Zk = K0
+        for j in js:
+            M = M * (Xk - xs[j] * Zk) % n
+        if count % _STAGE2_GCD == 0:
+            g = gcd(M, n)
+            if g != 1:
+                return g
+    return gcd(M, n)
+
+
+def lenstra_ecm(n, B1=10000, B2=None, max_curves=200, seed=1234):
+    r""" Use Lenstra's elliptic curve method to find a nontrivial factor of ``n``.
+
+    Explanation
+    ===========
+
+    Each curve is a Montgomery curve `By^2 = x^3 + Ax^2 + x` from Suyama's
+    parametrisation with a random `\sigma`, whose order modulo a prime
+    factor `p` is a multiple of 12. A factor `p` is found when the order
+    modulo `p` is ``B1``-smooth apart from one prime up to ``B2``. Unlike
+    ``pollard_pm1``, every curve gives a new order, so that trying more
+    curves finds larger factors. Only the `x` coordinates are computed.
+
+    Stage 1 multiplies the starting point by `\mathrm{lcm}(1, \ldots, B1)`
+    with the Montgomery ladder, and stage 2 is the baby-step giant-step
+    stage 2 of ``pollard_pm1`` with prime pairing.
+
+    Parameters
+    ==========
+
+    n : Integer
+        Positive integer to be factored
+    B1 : int
+        Stage 1 bound, at least 3
+    B2 : int | None
+        Stage 2 bound. ``100*B1`` if ``None``.
+    max_curves : int
+        Maximum number of curves to try
+    seed : int
+        Seed of the random `\sigma`, so that the curves are reproducible
+
+    Returns
+    =======
+
+    int | None : A nontrivial divisor of ``n``, ``2`` if ``n`` is even.
+        ``None`` if not found, in particular if ``n`` is prime.
+
+    Examples
+    ========
+
+    >>> from sympy.ntheory.factor_ import lenstra_ecm
+    >>> lenstra_ecm(1000000000000037 * 100000000000000000039, B1=2000)
+    1000000000000037
+
+    References
+    ==========
+
+    .. [1] H. W. Lenstra Jr., Factoring integers with elliptic curves,
+           Annals of Mathematics 126 (1987), 649-673
+    .. [2] P. L. Montgomery, Speeding the Pollard and Elliptic Curve Methods
+           of Factorization, Math. Comp. 48 (1987), 243-264
+
+    """
+    n = int(n)
+    if n < 7 or B1 < 3:
+        raise ValueError('lenstra_ecm should receive n > 6 and B1 > 2')
+    if n % 2 == 0:
+        return 2
+    if B2 is None:
+        B2 = 100 * B1
+    randint = _randint(seed + B1)
+    for _ in range(max_curves):
+        g = _ecm_curve(n, randint(6, n - 1), B1, B2)
+        if 1 < g < n:
+            return int(g)
+    return None
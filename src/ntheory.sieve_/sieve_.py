@@ -1,22 +1,497 @@
 from array import array as _array
+from bisect import bisect
+from itertools import accumulate
+from math import isqrt, pi
+import mmap as _mmap
+from multiprocessing import resource_tracker as _resource_tracker
+from multiprocessing import shared_memory as _shared_memory
+import os
+import struct
+import sys
+from time import perf_counter
+from sympy.external import import_module
 from sympy.utilities.misc import as_int
 from .factor_ import trailing, multiplicity
 
 
+# Number of odd numbers sieved at a time (an array of 8-byte entries fits in L2)
+_SEGMENT_SIZE = 1 << 16
+
+numpy = import_module('numpy')
+
+# dtype of the NumPy array for each typecode of the initial ``array``
+_NUMPY_DTYPES = {'Q': 'int64', 'b': 'int8', 'H': 'uint16', 'I': 'uint32'}
+_ARRAY_TYPECODES = {dtype: typecode for typecode, dtype in _NUMPY_DTYPES.items()}
+
+# File format of SieveBase.save: a header of _HEADER_SIZE bytes (magic, version,
+# byte order, class name, dtype, length of the sieve list, length of the table),
+# the sieve list, and then the table as int64 at the next multiple of 8 bytes.
+_FILE_MAGIC = b'SYMSIEVE'
+_FILE_VERSION = 1
+_HEADER = struct.Struct('<8sIc24s8sQQ')
+_HEADER_SIZE = 64
+
+# Residues modulo 30 coprime to 30, and their offsets among the odd numbers
+_WHEEL = (1, 7, 11, 13, 17, 19, 23, 29)
+_WHEEL_INDEX = {r: i for i, r in enumerate(_WHEEL)}
+_WHEEL_ODD = [r >> 1 for r in _WHEEL]
+# position in the wheel of each residue modulo 30 (0 if not coprime to 30)
+_WHEEL_POS = [_WHEEL_INDEX.get(r, 0) for r in range(30)]
+
+
+def _odd_primes(n, use_numpy=False):
+    """ Returns the list of odd primes ``p <= n``, or an int64 NumPy array
+    """
+    sieve = bytearray([1]) * ((n + 1) // 2)
+    if not sieve:
+        return numpy.zeros(0, dtype=numpy.int64) if use_numpy else []
+    sieve[0] = 0
+    for i in range(1, (isqrt(n) + 1) // 2):
+        if sieve[i]:
+            j = (2 * i + 1) * (2 * i + 1) // 2
+            sieve[j::2 * i + 1] = bytes(len(range(j, len(sieve), 2 * i + 1)))
+    if use_numpy:
+        return 2 * numpy.flatnonzero(numpy.frombuffer(sieve, dtype=numpy.uint8)) + 1
+    return [2 * i + 1 for i, b in enumerate(sieve) if b]
+
+
+def _smallest_factors(lo, hi, primes, use_numpy=False):
+    """ Returns the smallest prime factors of the odd numbers ``2*i + 1``
+    for ``lo <= i < hi``, where ``primes`` contains all odd primes up to
+    ``sqrt(2*hi - 1)``, as an ``array`` or a NumPy array
+    """
+    if use_numpy:
+        seg = numpy.arange(2 * lo + 1, 2 * hi, 2, dtype=numpy.int64)
+    else:
+        seg = _array('Q', range(2 * lo + 1, 2 * hi, 2))
+    # Sieving with larger primes first leaves the smallest one in each entry
+    for p in reversed(primes):
+        start = max(p * p, (2 * lo + p) // p * p)
+        if start % 2 == 0:
+            start += p
+        j = (start >> 1) - lo
+        if j < hi - lo:
+            if use_numpy:
+                seg[j::p] = p
+            else:
+                seg[j::p] = _array('Q', [p]) * len(range(j, hi - lo, p))
+    return seg
+
+
 class SieveBase:
     """ Basic class for sieve
+
+    The sieve holds the values for the odd numbers, ``2*i + 1`` at index ``i``.
+    It is extended segment by segment: the smallest prime factors of each
+    segment are found by striding only over the primes up to the square root
+    of the bound, and the values are then filled in by ``_extend_segment``.
+
+    If NumPy is available the values are kept in a NumPy array, and each
+    prime's strided update is a single slice operation (``_fill_segment``).
+    ``use_numpy=False`` selects the ``array`` version.
+
+    Indexing, slicing and the other queries extend the sieve automatically
+    when they go beyond it. If ``auto_extend`` is set to false they raise
+    ``ValueError`` instead, and no extension, automatic or not, may cover
+    numbers above ``max_size`` unless it is ``None``. :meth:`stats` reports
+    how often the sieve was extended and how long it took.
     """
 
-    def __init__(self, initial_list, n):
+    def __init__(self, initial_list, n, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        elif use_numpy and numpy is None:
+            raise ImportError("NumPy is not installed")
+        if use_numpy:
+            initial_list = numpy.array(initial_list, dtype=_NUMPY_DTYPES[initial_list.typecode])
+        self._use_numpy = use_numpy
         self._sieve_list = initial_list
         self._initial_length = len(self._sieve_list)
+        self._prefix = None
+        self.auto_extend = True
+        self.max_size = None
+        self._hits = self._auto_extends = self._extends = 0
+        self._extend_time = self._max_extend_time = self._last_extend_time = 0.0
         if n is not None:
             self.extend(n)
 
+    def extend(self, n):
+        """ Extend the sieve to n
+
+        Parameters
+        ==========
+
+        n : positive integer
+
+        Raises
+        ======
+
+        ValueError
+            If ``n`` is not an integer, or if the sieve would cover
+            numbers above ``max_size``.
+
+        """
+        n = as_int(n)
+        if n <= self._bound():
+            return
+        if self.max_size is not None and self.max_size < n - 1:
+            raise ValueError("extending the sieve to %d exceeds max_size = %d" % (n - 1, self.max_size))
+        start = perf_counter()
+        self._extend(n)
+        elapsed = perf_counter() - start
+        self._extends += 1
+        self._extend_time += elapsed
+        self._max_extend_time = max(self._max_extend_time, elapsed)
+        self._last_extend_time = elapsed
+
+    def _ensure(self, n):
+        """ Extend the sieve to ``n`` for a query, unless ``auto_extend`` is false,
+        or count a hit if the sieve already covers it
+        """
+        if n <= self._bound():
+            self._hits += 1
+            return
+        if not self.auto_extend:
+            raise ValueError("%d is beyond the sieve and auto_extend is off" % (n - 1))
+        self.extend(n)
+        self._auto_extends += 1
+
+    def _bound(self):
+        """ Returns ``n`` such that the sieve covers the numbers below ``n``
+        """
+        return 2 * len(self._sieve_list) + 1
+
+    def _extend(self, n):
+        """ Extend the sieve to the integer ``n`` beyond it
+        """
+        begin = len(self._sieve_list)
+        n >>= 1
+        if n <= begin:
+            return
+        primes = _odd_primes(isqrt(2 * n - 1))
+        if not self._use_numpy:
+            self._unmap()
+            for lo in range(begin, n, _SEGMENT_SIZE):
+                hi = min(lo + _SEGMENT_SIZE, n)
+                self._extend_segment(lo, hi, _smallest_factors(lo, hi, primes))
+            return
+        sieve_list = numpy.empty(n, dtype=self._sieve_list.dtype)
+        sieve_list[:begin] = self._sieve_list
+        self._sieve_list = sieve_list
+        lo = begin
+        while lo < n:
+            # (2*i + 1)/p <= (2*i + 1)/3 lies below the segment if i < 3*lo
+            hi = min(lo + _SEGMENT_SIZE, 3 * lo, n)
+            self._fill_segment(lo, hi, _smallest_factors(lo, hi, primes, True))
+            lo = hi
+
+    def _extend_segment(self, lo, hi, factors):
+        """ Append the values for ``lo <= i < hi`` given their smallest prime factors
+        """
+        raise NotImplementedError
+
+    def _fill_segment(self, lo, hi, factors):
+        """ Set ``self._sieve_list[lo:hi]`` given the smallest prime factors
+        as a NumPy array. The values below ``lo`` are already set.
+        """
+        raise NotImplementedError
+
     def reset(self):
         """ reset the sieve
         """
         self._sieve_list = self._sieve_list[:self._initial_length]
+        if self._use_numpy:
+            self._sieve_list = self._sieve_list.copy()
+        self._prefix = None
+
+    def _slice(self, key):
+        """ Returns the values for ``range(start, stop, step)`` of the slice ``key``
+        as a NumPy array or an ``array``
+        """
+        if key.stop is None:
+            raise ValueError("the stop of the slice must be given")
+        start = 1 if key.start is None else as_int(key.start)
+        stop = as_int(key.stop)
+        step = 1 if key.step is None else as_int(key.step)
+        if start < 1 or step < 1:
+            raise ValueError("start and step must be positive integers")
+        stop = max(start, stop)
+        self._ensure(stop)
+        values = self._range(start, stop)
+        return values if step == 1 else values[::step]
+
+    def _range(self, a, b):
+        """ Returns the values for ``a <= n < b``. The sieve covers ``b``.
+        """
+        raise NotImplementedError
+
+    def _odd_range(self, a, b):
+        """ Returns the sieve list for the odd numbers ``a <= n < b``
+        """
+        values = self._sieve_list[a // 2:b // 2]
+        if isinstance(values, memoryview):
+            return _array(values.format, values.tobytes())
+        return values
+
+    def _prefix_sums(self):
+        """ Returns the cached prefix sums of the sieve list, so that the
+        ``i``-th entry is the sum of the values for the odd numbers up to ``2*i + 1``
+        """
+        lst, prefix = self._sieve_list, self._prefix
+        begin = 0 if prefix is None else len(prefix)
+        if begin < len(lst):
+            last = int(prefix[-1]) if begin else 0
+            if self._use_numpy:
+                sums = last + numpy.cumsum(lst[begin:], dtype=numpy.int64)
+                self._prefix = sums if prefix is None else numpy.concatenate([prefix, sums])
+            else:
+                sums = _array('q', accumulate(lst[begin:], initial=last))[1:]
+                self._prefix = sums if prefix is None else prefix + sums
+        return self._prefix
+
+    def _odd_sum(self, x):
+        """ Returns the sum of the values for the odd numbers up to ``x``. The sieve covers ``x``.
+        """
+        return int(self._prefix_sums()[(x - 1) >> 1]) if 0 < x else 0
+
+    def _odd_sum_array(self, y):
+        """ :meth:`_odd_sum` for each entry of the NumPy array ``y``
+        """
+        return numpy.where(0 < y, self._prefix_sums()[(y - 1) >> 1], 0)
+
+    def stats(self):
+        """ Returns a dictionary of counters of the sieve
+
+        ``hits`` is the number of queries answered within the sieve (an
+        item, a slice, or a call of ``factorint_many`` or ``prefix_sum``),
+        and ``auto_extends`` the number of queries that extended it. ``extends``
+        counts all the extensions, which took ``extend_time`` seconds in
+        total, ``max_extend_time`` at most and ``last_extend_time`` for the
+        last one. The sieve covers the numbers below ``bound``, and
+        ``nbytes`` is the memory held by the sieve list and its caches.
+
+        Examples
+        ========
+
+        >>> from sympy.ntheory.sieve_ import FactorSieve
+        >>> fsieve = FactorSieve(100)
+        >>> fsieve[35], fsieve[1001]
+        (5, 7)
+        >>> stats = fsieve.stats()
+        >>> stats['hits'], stats['auto_extends'], stats['extends']
+        (1, 1, 2)
+        >>> fsieve.auto_extend = False
+        >>> fsieve[10**6 + 1]
+        Traceback (most recent call last):
+        ...
+        ValueError: 1000001 is beyond the sieve and auto_extend is off
+
+        """
+        return {
+            'hits': self._hits,
+            'auto_extends': self._auto_extends,
+            'extends': self._extends,
+            'extend_time': self._extend_time,
+            'max_extend_time': self._max_extend_time,
+            'last_extend_time': self._last_extend_time,
+            'bound': self._bound(),
+            'nbytes': self._nbytes(),
+        }
+
+    def _nbytes(self):
+        """ Returns the number of bytes of the sieve list, the prefix sums and the table
+        """
+        nbytes = memoryview(self._sieve_list).nbytes + 8 * len(self._table())
+        if self._prefix is not None:
+            nbytes += memoryview(self._prefix).nbytes
+        return nbytes
+
+    def _unmap(self):
+        """ Copy a sieve list memory-mapped without NumPy into an ``array``
+        """
+        if isinstance(self._sieve_list, memoryview):
+            self._sieve_list = _array(self._sieve_list.format, self._sieve_list.tobytes())
+
+    def _table(self):
+        """ Extra integers stored after the sieve list by :meth:`save`
+        """
+        return []
+
+    def _set_table(self, table):
+        pass
+
+    def _pack(self):
+        """ Returns the header, the sieve list and the table written by :meth:`save`
+        """
+        data = self._sieve_list
+        if self._use_numpy:
+            dtype = data.dtype.name
+        else:
+            dtype = _NUMPY_DTYPES[data.format if isinstance(data, memoryview) else data.typecode]
+        table = _array('q', self._table())
+        header = _HEADER.pack(_FILE_MAGIC, _FILE_VERSION, sys.byteorder[0].encode(),
+                              type(self).__name__.encode(), dtype.encode(), len(data), len(table))
+        return header.ljust(_HEADER_SIZE, b'\0'), data, table
+
+    @classmethod
+    def _unpack_header(cls, header, source):
+        """ Returns the dtype, the length of the sieve list and the
+        length of the table from the header written by :meth:`save`
+        """
+        if len(header) < _HEADER.size:
+            raise ValueError("%s is not a sieve file" % source)
+        magic, version, byteorder, name, dtype, length, table_length = _HEADER.unpack_from(header)
+        if magic != _FILE_MAGIC:
+            raise ValueError("%s is not a sieve file" % source)
+        if version != _FILE_VERSION:
+            raise ValueError("unsupported sieve file version %d" % version)
+        if byteorder != sys.byteorder[0].encode():
+            raise ValueError("%s was saved with a different byte order" % source)
+        if name.rstrip(b'\0').decode() != cls.__name__:
+            raise ValueError("%s is not a %s" % (source, cls.__name__))
+        return dtype.rstrip(b'\0').decode(), length, table_length
+
+    def save(self, path):
+        """ Save the sieve to the file ``path``
+
+        The file can be opened by :meth:`open` of the same class, also
+        memory-mapped and shared by several processes.
+
+        Examples
+        ========
+
+        >>> from sympy.ntheory.sieve_ import FactorSieve
+        >>> FactorSieve(10**6).save('factor.sieve') # doctest: +SKIP
+        >>> fsieve = FactorSieve.open('factor.sieve') # doctest: +SKIP
+        >>> fsieve[999997] # doctest: +SKIP
+        757
+
+        """
+        header, data, table = self._pack()
+        with open(path, 'wb') as f:
+            f.write(header)
+            f.write(data)
+            f.write(bytes(-f.tell() % 8))
+            f.write(table)
+
+    @classmethod
+    def open(cls, path, mmap=True, use_numpy=None):
+        """ Open a sieve saved by :meth:`save`
+
+        If ``mmap`` is true the sieve list is memory-mapped read-only, so
+        that opening is immediate and the pages are shared between the
+        processes that open the same file. Extending the sieve copies it
+        into memory.
+
+        Raises
+        ======
+
+        ValueError
+            If the file is not a sieve of this class saved in a supported
+            version on a machine of the same byte order.
+
+        """
+        sieve = cls(use_numpy=use_numpy)
+        with open(path, 'rb') as f:
+            dtype, length, table_length = cls._unpack_header(f.read(_HEADER_SIZE), path)
+            typecode = _ARRAY_TYPECODES[dtype]
+            size = length * _array(typecode).itemsize
+            f.seek(_HEADER_SIZE + size + (-size % 8))
+            table = _array('q')
+            table.frombytes(f.read(8 * table_length))
+            sieve._set_table(table.tolist())
+            if sieve._use_numpy:
+                if mmap:
+                    data = numpy.memmap(path, dtype=dtype, mode='r', offset=_HEADER_SIZE, shape=(length,))
+                else:
+                    f.seek(_HEADER_SIZE)
+                    data = numpy.frombuffer(bytearray(f.read(size)), dtype=dtype)
+            elif mmap:
+                data = memoryview(_mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ))
+                data = data[_HEADER_SIZE:_HEADER_SIZE + size].cast(typecode)
+            else:
+                f.seek(_HEADER_SIZE)
+                data = _array(typecode, f.read(size))
+        sieve._sieve_list = data
+        return sieve
+
+    def share(self):
+        """ Copy the sieve into a new block of shared memory
+
+        Returns the :class:`multiprocessing.shared_memory.SharedMemory`,
+        whose ``name`` is passed to :meth:`attach` in the other processes.
+        The block is laid out as the file written by :meth:`save`. The
+        caller closes it, and unlinks it once no process needs it.
+
+        Examples
+        ========
+
+        >>> from sympy.ntheory.sieve_ import FactorSieve
+        >>> shm = FactorSieve(10**6).share()
+        >>> fsieve = FactorSieve.attach(shm.name)
+        >>> fsieve[999997]
+        757
+        >>> del fsieve
+        >>> shm.close()
+        >>> shm.unlink()
+
+        """
+        header, data, table = self._pack()
+        size = _HEADER_SIZE + memoryview(data).nbytes
+        size += -size % 8
+        shm = _shared_memory.SharedMemory(create=True, size=size + 8 * len(table))
+        buf = shm.buf
+        buf[:_HEADER_SIZE] = header
+        buf[_HEADER_SIZE:_HEADER_SIZE + memoryview(data).nbytes] = memoryview(data).cast('B')
+        buf[size:size + 8 * len(table)] = memoryview(table).cast('B')
+        del buf
+        return shm
+
+    @classmethod
+    def attach(cls, name, use_numpy=None):
+        """ Attach to a sieve shared by :meth:`share` under ``name``
+
+        The sieve list is a read-only view of the shared memory, so that all
+        the processes read the same copy. Extending the sieve copies it into
+        the memory of the process. The shared memory is released when the
+        sieve is deleted.
+
+        Raises
+        ======
+
+        ValueError
+            If the shared memory does not hold a sieve of this class.
+
+        """
+        sieve = cls(use_numpy=use_numpy)
+        # the process that shared the sieve unlinks it, not the resource
+        # tracker of this process when it exits
+        if sys.version_info >= (3, 13):
+            shm = _shared_memory.SharedMemory(name, track=False)
+        else:
+            shm = _shared_memory.SharedMemory(name)
+            if os.name == 'posix':
+                _resource_tracker.unregister(shm._name, "shared_memory")
+        buf = shm.buf.toreadonly()
+        try:
+            dtype, length, table_length = cls._unpack_header(bytes(buf[:_HEADER_SIZE]), name)
+        except ValueError:
+            buf.release()
+            shm.close()
+            raise
+        typecode = _ARRAY_TYPECODES[dtype]
+        size = length * _array(typecode).itemsize
+        begin = _HEADER_SIZE + size + (-size % 8)
+        sieve._set_table(buf[begin:begin + 8 * table_length].cast('q').tolist())
+        if sieve._use_numpy:
+            data = numpy.frombuffer(buf, dtype=dtype, count=length, offset=_HEADER_SIZE)
+        else:
+            data = buf[_HEADER_SIZE:_HEADER_SIZE + size].cast(typecode)
+        del buf
+        # the views are released before the shared memory is closed
+        sieve._sieve_list = data
+        sieve._shm = shm
+        return sieve
 
 
 class FactorSieve(SieveBase):
@@ -36,51 +511,42 @@ class FactorSieve(SieveBase):
 
     """
 
-    def __init__(self, n=None):
-        super().__init__(_array('L', [1, 3, 5]), n)
-
-    def extend(self, n):
-        """ Extend the sieve to n
+    def __init__(self, n=None, use_numpy=None):
+        super().__init__(_array('Q', [1, 3, 5]), n, use_numpy)
 
-        Parameters
-        ==========
+    def _extend_segment(self, lo, hi, factors):
+        self._sieve_list += factors
 
-        n : positive integer
+    def _fill_segment(self, lo, hi, factors):
+        self._sieve_list[lo:hi] = factors
 
-        Raises
-        ======
-
-        ValueError
-            If ``2**32 < n`` or ``n`` is not an integer.
+    def _range(self, a, b):
+        odd = self._odd_range(a, b)
+        if self._use_numpy:
+            values = numpy.full(b - a, 2, dtype=numpy.int64)
+        else:
+            values = _array('Q', [2]) * (b - a)
+        values[(a + 1) % 2::2] = odd
+        return values
 
+    def _spf(self, n):
+        """ Returns the smallest prime factor of an odd ``n > 1`` covered by the sieve
         """
-        n = as_int(n)
-        begin = len(self._sieve_list)
-        n >>= 1
-        if n < begin:
-            return
-        self._sieve_list += _array('L', range(2 * begin + 1, 2 * n, 2))
-        for i in range(1, begin):
-            val = self._sieve_list[i]
-            i2 = 2 * i + 1
-            k = (begin + i) // i2
-            for j in range(k * i2 + i, n, i2):
-                self._sieve_list[j] = min(val, self._sieve_list[j])
-        for i in range(begin, (n + 1) // 3):
-            val = self._sieve_list[i]
-            i2 = 2 * i + 1
-            for j in range(i2 + i, n, i2):
-                self._sieve_list[j] = min(val, self._sieve_list[j])
+        return int(self._sieve_list[n >> 1])
 
     def __getitem__(self, n):
+        if isinstance(n, slice):
+            return self._slice(n)
         n = as_int(n)
         if n < 1:
             raise ValueError("n must be a positive integer")
         if n % 2 == 0:
             return 2
         if len(self._sieve_list) <= n >> 1:
-            self.extend(n + 1)
-        return self._sieve_list[n >> 1]
+            self._ensure(n + 1)
+        else:
+            self._hits += 1
+        return int(self._sieve_list[n >> 1])
 
     def factorint(self, n):
         """ Returns the prime factorization of ``n``
@@ -111,7 +577,7 @@ class FactorSieve(SieveBase):
 
         """
         factors = {}
-        n = as_int(n)
+        n = abs(as_int(n))
         t = trailing(n)
         if t:
             n >>= t
@@ -123,6 +589,157 @@ class FactorSieve(SieveBase):
             n //= p**t
         return factors
 
+    def factorint_many(self, ns):
+        """ Returns the list of the prime factorizations of the integers in ``ns``
+
+        The sieve is extended once to cover all of them, and the factors
+        are read from the sieve directly.
+
+        Examples
+        ========
+
+        >>> from sympy.ntheory.sieve_ import FactorSieve
+        >>> fsieve = FactorSieve()
+        >>> fsieve.factorint_many([100, -7, 1])
+        [{2: 2, 5: 2}, {7: 1}, {}]
+
+        See Also
+        ========
+
+        factorint
+
+        """
+        ns = [abs(as_int(n)) for n in ns]
+        if ns:
+            self._ensure(max(ns) + 1)
+        spf = self._spf
+        result = []
+        for n in ns:
+            factors = {}
+            t = (n & -n).bit_length() - 1
+            if 0 < t:
+                n >>= t
+                factors[2] = t
+            while n > 1:
+                p = spf(n)
+                t = 0
+                while n % p == 0:
+                    n //= p
+                    t += 1
+                factors[p] = t
+            result.append(factors)
+        return result
+
+
+class CompactFactorSieve(FactorSieve):
+    """ Prime factor sieve with compact storage
+
+    Only the numbers coprime to 30 are stored, 8 out of every 30, each as
+    the index of its smallest prime factor in a table of primes, or 0 if
+    the number is prime (or 1). The entries are ``uint16``, and become
+    ``uint32`` once the table outgrows them (beyond about ``6.7*10**11``).
+    This is about 7.5 times smaller than :class:`FactorSieve`.
+
+    Examples
+    ========
+
+    >>> from sympy.ntheory.sieve_ import CompactFactorSieve
+    >>> fsieve = CompactFactorSieve(100) # Creates the sieve up to 100
+    >>> fsieve[35] # Returns the smallest prime factor
+    5
+    >>> fsieve[143] # The sieve is automatically expanded
+    11
+    >>> fsieve.factorint(1001)
+    {7: 1, 11: 1, 13: 1}
+
+    """
+
+    def __init__(self, n=None, use_numpy=None):
+        self._primes = [0]
+        SieveBase.__init__(self, _array('H', [0] * 8), n, use_numpy)
+
+    def _bound(self):
+        return 30 * (len(self._sieve_list) // 8)
+
+    def _extend(self, n):
+        begin = len(self._sieve_list) // 8
+        end = (n + 29) // 30
+        if end <= begin:
+            return
+        primes = _odd_primes(isqrt(30 * end - 1))
+        # the table holds the primes from 7 on, after the escape entry 0
+        self._primes += primes[len(self._primes) + 1:]
+        if not self._use_numpy:
+            self._unmap()
+        if 1 << 16 < len(self._primes):
+            if self._use_numpy and self._sieve_list.dtype == numpy.uint16:
+                self._sieve_list = self._sieve_list.astype(numpy.uint32)
+            elif not self._use_numpy and self._sieve_list.typecode == 'H':
+                self._sieve_list = _array('I', self._sieve_list)
+        step = _SEGMENT_SIZE // 15
+        if self._use_numpy:
+            sieve_list = numpy.empty(8 * end, dtype=self._sieve_list.dtype)
+            sieve_list[:8 * begin] = self._sieve_list
+            self._sieve_list = sieve_list
+            # table[p] is the index of the prime p; larger factors are primes themselves
+            table = numpy.zeros(self._primes[-1] + 1, dtype=self._sieve_list.dtype)
+            table[self._primes] = numpy.arange(len(self._primes))
+            for lo in range(begin, end, step):
+                hi = min(lo + step, end)
+                factors = _smallest_factors(15 * lo, 15 * hi, primes, True).reshape(-1, 15)[:, _WHEEL_ODD]
+                m = 30 * numpy.arange(lo, hi)[:, None] + numpy.array(_WHEEL)
+                index = numpy.where(factors == m, 0, table[numpy.minimum(factors, len(table) - 1)])
+                sieve_list[8 * lo:8 * hi] = index.ravel()
+            return
+        index = {p: i for i, p in enumerate(self._primes)}
+        for lo in range(begin, end, step):
+            hi = min(lo + step, end)
+            factors = _smallest_factors(15 * lo, 15 * hi, primes)
+            self._sieve_list += _array(self._sieve_list.typecode,
+                [0 if p == 30 * k + r else index[p]
+                 for k in range(lo, hi) for p, r in zip(
+                     (factors[15 * (k - lo) + j] for j in _WHEEL_ODD), _WHEEL)])
+
+    def _table(self):
+        return self._primes
+
+    def _set_table(self, table):
+        self._primes = table
+
+    def _range(self, a, b):
+        lst, primes = self._sieve_list, self._primes
+        if not self._use_numpy:
+            return _array('Q', [self._spf(n) if n % 2 else 2 for n in range(a, b)])
+        n = numpy.arange(a, b)
+        k = lst[n // 30 * 8 + numpy.array(_WHEEL_POS)[n % 30]]
+        values = numpy.where(k == 0, n, numpy.array(primes, dtype=numpy.int64)[k])
+        for p in [5, 3, 2]:
+            values[n % p == 0] = p
+        return values
+
+    def _spf(self, n):
+        for p in [3, 5]:
+            if n % p == 0:
+                return p
+        k = self._sieve_list[n // 30 * 8 + _WHEEL_INDEX[n % 30]]
+        return self._primes[k] if k else n
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return self._slice(n)
+        n = as_int(n)
+        if n < 1:
+            raise ValueError("n must be a positive integer")
+        for p in [2, 3, 5]:
+            if n % p == 0:
+                return p
+        if len(self._sieve_list) <= n // 30 * 8:
+            self._ensure(n + 1)
+        else:
+            self._hits += 1
+        k = self._sieve_list[n // 30 * 8 + _WHEEL_INDEX[n % 30]]
+        return self._primes[k] if k else n
+
 
 class TotientSieve(SieveBase):
     """ Totient function sieve
@@ -144,52 +761,81 @@ class TotientSieve(SieveBase):
 
     """
 
-    def __init__(self, n=None):
-        super().__init__(_array('L', [1, 2, 4]), n)
+    def __init__(self, n=None, use_numpy=None):
+        super().__init__(_array('Q', [1, 2, 4]), n, use_numpy)
 
-    def extend(self, n):
-        """ Extend the sieve to n
+    def _extend_segment(self, lo, hi, factors):
+        # phi(n) = phi(n/p) * (p or p - 1) for the smallest prime factor p of n
+        lst = self._sieve_list
+        lst += factors
+        for i in range(lo, hi):
+            p = lst[i]
+            m = (2 * i + 1) // p
+            lst[i] = lst[m >> 1] * (p if m % p == 0 else p - 1)
 
-        Parameters
-        ==========
+    def _fill_segment(self, lo, hi, factors):
+        lst = self._sieve_list
+        m = numpy.arange(2 * lo + 1, 2 * hi, 2) // factors
+        lst[lo:hi] = lst[m >> 1] * numpy.where(m % factors == 0, factors, factors - 1)
 
-        n : positive integer
+    def _range(self, a, b):
+        lst = self._sieve_list
+        if self._use_numpy:
+            # n = low * m with low the largest power of 2 dividing n
+            n = numpy.arange(a, b)
+            low = n & -n
+            values = lst[(n // low) >> 1]
+            return numpy.where(low == 1, values, values * (low >> 1))
+        return _array('Q', [lst[(n // (n & -n)) >> 1] * ((n & -n) >> 1 or 1) for n in range(a, b)])
 
-        Raises
-        ======
+    def prefix_sum(self, x):
+        r""" Returns `\Phi(x) = \sum_{n \le x} \phi(n)`
 
-        ValueError
-            If ``2**32 < n`` or ``n`` is not an integer.
+        The prefix sums of the sieve are cached, and
+        `\Phi(x) = \sum_{t \ge 0} \max(1, 2^{t-1}) S(x/2^t)` where `S(y)`
+        is the sum over the odd numbers up to `y`.
+
+        Examples
+        ========
+
+        >>> from sympy.ntheory.sieve_ import TotientSieve
+        >>> TotientSieve().prefix_sum(10)
+        32
 
         """
-        n = as_int(n)
-        begin = len(self._sieve_list)
-        n >>= 1
-        if n < begin:
-            return
-        self._sieve_list += _array('L', range(2 * begin + 1, 2 * n, 2))
-        for i in range(begin):
-            val = self._sieve_list[i]
-            i2 = 2 * i + 1
-            k = (begin + i) // i2
-            for j in range(k * i2 + i, n, i2):
-                self._sieve_list[j] -= val
-        for i in range(begin, (n + 1) // 3):
-            val = self._sieve_list[i]
-            i2 = 2 * i + 1
-            for j in range(i2 + i, n, i2):
-                self._sieve_list[j] -= val
+        x = as_int(x)
+        self._ensure(x + 1)
+        total = self._odd_sum(x)
+        t = 1
+        while x >> t:
+            total += self._odd_sum(x >> t) << (t - 1)
+            t += 1
+        return total
+
+    def _prefix_sum_array(self, y):
+        """ :meth:`prefix_sum` for each entry of the NumPy array ``y``. The sieve covers ``y``.
+        """
+        total = self._odd_sum_array(y)
+        t = 1
+        while (y >> t).any():
+            total += self._odd_sum_array(y >> t) << (t - 1)
+            t += 1
+        return total
 
     def __getitem__(self, n):
+        if isinstance(n, slice):
+            return self._slice(n)
         n = as_int(n)
         if n < 1:
             raise ValueError("n must be a positive integer")
         if len(self._sieve_list) <= n >> 1:
-            self.extend(n + 1)
+            self._ensure(n + 1)
+        else:
+            self._hits += 1
         t = trailing(n)
         if t:
-            return self._sieve_list[n >> (t + 1)] << (t - 1)
-        return self._sieve_list[n >> 1]
+            return int(self._sieve_list[n >> (t + 1)]) << (t - 1)
+        return int(self._sieve_list[n >> 1])
 
 
 class MobiusSieve(SieveBase):
@@ -211,8 +857,153 @@ class MobiusSieve(SieveBase):
     sympy.ntheory.residue_ntheory.mobius
 
     """
-    def __init__(self, n=None):
-        super().__init__(_array('i', [1, -1, -1]), n)
+    def __init__(self, n=None, use_numpy=None):
+        super().__init__(_array('b', [1, -1, -1]), n, use_numpy)
+
+    def _extend_segment(self, lo, hi, factors):
+        # mu(n) = -mu(n/p), or 0 if p divides n/p, for the smallest prime factor p of n
+        lst = self._sieve_list
+        lst += _array('b', [0]) * (hi - lo)
+        for i, p in zip(range(lo, hi), factors):
+            m = (2 * i + 1) // p
+            lst[i] = 0 if m % p == 0 else -lst[m >> 1]
+
+    def _fill_segment(self, lo, hi, factors):
+        lst = self._sieve_list
+        m = numpy.arange(2 * lo + 1, 2 * hi, 2) // factors
+        lst[lo:hi] = numpy.where(m % factors == 0, 0, -lst[m >> 1])
+
+    def _range(self, a, b):
+        lst = self._sieve_list
+        if self._use_numpy:
+            n = numpy.arange(a, b)
+            low = n & -n
+            values = lst[(n // low) >> 1]
+            return numpy.where(low == 1, values, numpy.where(low == 2, -values, 0)).astype(numpy.int8)
+        return _array('b', [(1, -1, 0, 0)[min(n & -n, 4) - 1] * lst[(n // (n & -n)) >> 1]
+                            for n in range(a, b)])
+
+    def prefix_sum(self, x):
+        r""" Returns the Mertens function `M(x) = \sum_{n \le x} \mu(n)`
+
+        The prefix sums of the sieve are cached, and `M(x) = S(x) - S(x/2)`
+        where `S(y)` is the sum over the odd numbers up to `y`.
+
+        Examples
+        ========
+
+        >>> from sympy.ntheory.sieve_ import MobiusSieve
+        >>> MobiusSieve().prefix_sum(10)
+        -1
+
+        """
+        x = as_int(x)
+        self._ensure(x + 1)
+        return self._odd_sum(x) - self._odd_sum(x >> 1)
+
+    def _prefix_sum_array(self, y):
+        """ :meth:`prefix_sum` for each entry of the NumPy array ``y``. The sieve covers ``y``.
+        """
+        return self._odd_sum_array(y) - self._odd_sum_array(y >> 1)
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return self._slice(n)
+        n = as_int(n)
+        if n < 1:
+            raise ValueError("n must be a positive integer")
+        if len(self._sieve_list) <= n >> 1:
+            self._ensure(n + 1)
+        else:
+            self._hits += 1
+        t = trailing(n)
+        if t > 1:
+            return 0
+        return pow(-1, t % 2) * int(self._sieve_list[n >> (t + 1)])
+
+
+class MultiplicativeSieve:
+    """ Sieve of a multiplicative (or additive) function given on prime powers
+
+    ``f(p, e)`` is the value at ``p**e``. The value at ``n = p**e * m``
+    with ``p`` the smallest prime factor of ``n`` and ``gcd(p, m) = 1`` is
+    ``f(p, e) * self[m]``, or ``f(p, e) + self[m]`` if ``additive`` is true.
+    The smallest prime factors are read from a :class:`FactorSieve`, and
+    ``f`` is called once per prime power.
+
+    All ``n`` are stored, in an ``array`` or a NumPy array of ``typecode``
+    (``'q'``, int64, by default). With NumPy, the values are filled in for
+    `[lo, 2 lo)` at a time, as both factors of ``n`` lie below ``lo``.
+    The values must fit in ``typecode``: the ``array`` raises
+    ``OverflowError`` otherwise, while NumPy only checks the values at the
+    prime powers and silently wraps around the sums and products.
+
+    A slice ``self[a:b:c]`` is the values for ``range(a, b, c)``, and
+    ``a`` defaults to ``1``.
+
+    Examples
+    ========
+
+    >>> from sympy.ntheory.sieve_ import MultiplicativeSieve
+    >>> sigma = MultiplicativeSieve(lambda p, e: (p**(e + 1) - 1) // (p - 1), 100)
+    >>> sigma[12]
+    28
+    >>> MultiplicativeSieve.primeomega()[1:13].tolist()
+    [0, 1, 1, 2, 1, 2, 1, 3, 2, 2, 1, 3]
+
+    """
+
+    def __init__(self, f, n=None, additive=False, typecode='q', factor_sieve=None, use_numpy=None):
+        if factor_sieve is None:
+            factor_sieve = FactorSieve(use_numpy=use_numpy)
+        self._f = f
+        self._additive = additive
+        self._factor = factor_sieve
+        self._use_numpy = factor_sieve._use_numpy
+        initial = [0, 0 if additive else 1]
+        if self._use_numpy:
+            self._list = numpy.array(initial, dtype=typecode)
+        else:
+            self._list = _array(typecode, initial)
+        if n is not None:
+            self.extend(n)
+
+    @classmethod
+    def divisor_sigma(cls, k=1, n=None, **kwargs):
+        r""" Sieve of `\sigma_k(n)`, the sum of the ``k``-th powers of the divisors """
+        if k == 0:
+            return cls.divisor_count(n, **kwargs)
+        return cls(lambda p, e: (p**(k * (e + 1)) - 1) // (p**k - 1), n, **kwargs)
+
+    @classmethod
+    def divisor_count(cls, n=None, **kwargs):
+        r""" Sieve of `\tau(n)`, the number of divisors """
+        return cls(lambda p, e: e + 1, n, **kwargs)
+
+    @classmethod
+    def primenu(cls, n=None, **kwargs):
+        r""" Sieve of `\omega(n)`, the number of distinct prime factors """
+        return cls(lambda p, e: 1, n, additive=True, **kwargs)
+
+    @classmethod
+    def primeomega(cls, n=None, **kwargs):
+        r""" Sieve of `\Omega(n)`, the number of prime factors with multiplicity """
+        return cls(lambda p, e: e, n, additive=True, **kwargs)
+
+    @classmethod
+    def liouville(cls, n=None, **kwargs):
+        r""" Sieve of `\lambda(n) = (-1)^{\Omega(n)}` """
+        return cls(lambda p, e: -1 if e % 2 else 1, n, **kwargs)
+
+    @classmethod
+    def mobius(cls, n=None, **kwargs):
+        r""" Sieve of `\mu(n)` """
+        return cls(lambda p, e: -1 if e == 1 else 0, n, **kwargs)
+
+    @classmethod
+    def totient(cls, n=None, **kwargs):
+        r""" Sieve of `\phi(n)` """
+        return cls(lambda p, e: p**(e - 1) * (p - 1), n, **kwargs)
 
     def extend(self, n):
         """ Extend the sieve to n
@@ -230,30 +1021,365 @@ class MobiusSieve(SieveBase):
 
         """
         n = as_int(n)
-        begin = len(self._sieve_list)
-        n >>= 1
-        if n < begin:
+        begin = len(self._list)
+        if n <= begin:
+            return
+        f = self._f
+        spf = self._factor[begin:n]
+        if not self._use_numpy:
+            lst = self._list
+            for k, p in zip(range(begin, n), spf):
+                m, pe, e = k // p, p, 1
+                while m % p == 0:
+                    m //= p
+                    pe *= p
+                    e += 1
+                if m == 1:
+                    lst.append(f(p, e))
+                elif self._additive:
+                    lst.append(lst[m] + lst[pe])
+                else:
+                    lst.append(lst[m] * lst[pe])
             return
-        self._sieve_list += _array('i', [0] * (n - begin))
-        for i in range(begin):
-            val = self._sieve_list[i]
-            i2 = 2 * i + 1
-            k = (begin + i) // i2
-            for j in range(k * i2 + i, n, i2):
-                self._sieve_list[j] -= val
-        for i in range(begin, (n + 1) // 3):
-            val = self._sieve_list[i]
-            i2 = 2 * i + 1
-            for j in range(i2 + i, n, i2):
-                self._sieve_list[j] -= val
+        lst = numpy.empty(n, dtype=self._list.dtype)
+        lst[:begin] = self._list
+        self._list = lst
+        k = numpy.arange(begin, n)
+        # pe = p**e is the largest power of p = spf dividing k
+        pe, e = spf.copy(), numpy.ones_like(spf)
+        more = numpy.flatnonzero(k // pe % spf == 0)
+        while more.size:
+            pe[more] *= spf[more]
+            e[more] += 1
+            more = more[k[more] // pe[more] % spf[more] == 0]
+        prime_power = pe == k
+        lst[k[prime_power]] = [f(p, i) for p, i in zip(spf[prime_power].tolist(), e[prime_power].tolist())]
+        k, pe = k[~prime_power], pe[~prime_power]
+        lo = begin
+        while lo < n:
+            hi = min(2 * lo, n)
+            block = slice(*numpy.searchsorted(k, [lo, hi]))
+            m, q = k[block] // pe[block], pe[block]
+            lst[k[block]] = lst[m] + lst[q] if self._additive else lst[m] * lst[q]
+            lo = hi
 
     def __getitem__(self, n):
+        if isinstance(n, slice):
+            if n.stop is None:
+                raise ValueError("the stop of the slice must be given")
+            start = 1 if n.start is None else as_int(n.start)
+            stop = as_int(n.stop)
+            step = 1 if n.step is None else as_int(n.step)
+            if start < 1 or step < 1:
+                raise ValueError("start and step must be positive integers")
+            if len(self._list) < stop:
+                self.extend(stop)
+            return self._list[start:stop:step]
         n = as_int(n)
         if n < 1:
             raise ValueError("n must be a positive integer")
-        if len(self._sieve_list) <= n >> 1:
+        if len(self._list) <= n:
             self.extend(n + 1)
-        t = trailing(n)
-        if t > 1:
-            return 0
-        return pow(-1, t % 2) * self._sieve_list[n >> (t + 1)]
+        return int(self._list[n])
+
+
+def _window_factors(lo, hi, primes, nxt, base):
+    """ Returns ``offsets``, ``ps`` and ``es``, NumPy arrays such that the
+    factorization of ``lo + i`` is ``ps[offsets[i]:offsets[i + 1]]`` with the
+    exponents ``es[offsets[i]:offsets[i + 1]]``, where ``primes`` is the NumPy
+    array of all primes up to ``sqrt(hi - 1)``
+
+    ``nxt[j]`` is the first multiple of ``primes[j]`` from ``lo``, less
+    ``base``, and is moved on to the first one from ``hi``.
+    """
+    L = hi - lo
+    n = numpy.arange(lo, hi, dtype=numpy.int64)
+    hit = numpy.flatnonzero(nxt < hi - base)
+    P, first = primes[hit], nxt[hit] - (lo - base)
+    counts = (L - 1 - first) // P + 1
+    nxt[hit] += counts * P
+    # the pairs (idx, ps) of the multiples lo + idx of each prime p in ps
+    starts = numpy.cumsum(counts) - counts
+    ps = numpy.repeat(P, counts)
+    idx = numpy.repeat(first, counts) + (numpy.arange(counts.sum()) - numpy.repeat(starts, counts)) * ps
+    # a stable sort of 16-bit keys is a radix sort
+    order = numpy.argsort(idx.astype(numpy.uint16) if L <= 1 << 16 else idx, kind='stable')
+    idx, ps = idx[order], ps[order]
+    # m = n // p**e is the part of n prime to p
+    m, es = n[idx] // ps, numpy.ones(len(ps), dtype=numpy.uint8)
+    more = numpy.flatnonzero(m % ps == 0)
+    while more.size:
+        m[more] //= ps[more]
+        es[more] += 1
+        more = more[m[more] % ps[more] == 0]
+    counts = numpy.bincount(idx, minlength=L)
+    offsets = numpy.zeros(L + 1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=offsets[1:])
+    rest = n.copy()
+    found = numpy.flatnonzero(counts)
+    rest[found] //= numpy.multiply.reduceat(n[idx] // m, offsets[found])
+    # what is left is 1 or a prime above sqrt(hi - 1), the largest factor of n
+    large = rest > 1
+    if not large.any():
+        return offsets, ps, es
+    rank = numpy.arange(len(ps)) - offsets[idx]
+    numpy.cumsum(counts + large, out=offsets[1:])
+    total = int(offsets[-1])
+    all_ps = numpy.empty(total, dtype=numpy.int64)
+    all_es = numpy.ones(total, dtype=numpy.uint8)
+    all_ps[offsets[idx] + rank] = ps
+    all_es[offsets[idx] + rank] = es
+    all_ps[offsets[1:][large] - 1] = rest[large]
+    return offsets, all_ps, all_es
+
+
+def factorint_range(a, b, packed=False, chunk_size=None, use_numpy=None):
+    """ Generates the prime factorizations of the integers in ``[a, b)``
+
+    Only the window is sieved, with the primes up to ``sqrt(b - 1)``, so
+    ``a`` may be far larger than any :class:`FactorSieve`. It is done
+    ``chunk_size`` integers at a time, and apart from the primes the
+    memory used is proportional to ``chunk_size``.
+
+    By default the pairs ``(n, factors)`` are generated, with ``factors``
+    the dictionary given by ``factorint(n)``. If ``packed`` is true, a tuple
+    ``(lo, offsets, primes, exponents)`` is generated for each chunk instead,
+    and the factors of ``lo + i`` are ``primes[offsets[i]:offsets[i + 1]]``
+    in increasing order, with ``exponents`` in the same positions. These are
+    NumPy arrays with NumPy, and ``array`` objects otherwise.
+
+    Parameters
+    ==========
+
+    a, b : positive integers
+    packed : bool
+    chunk_size : positive integer, the number of integers sieved at a time
+    use_numpy : bool, whether to use NumPy (by default if it is installed
+        and ``b <= 2**63``)
+
+    Examples
+    ========
+
+    >>> from sympy.ntheory.sieve_ import factorint_range
+    >>> for n, factors in factorint_range(10**15, 10**15 + 3):
+    ...     print(n, factors)
+    1000000000000000 {2: 15, 5: 15}
+    1000000000000001 {7: 1, 11: 1, 13: 1, 211: 1, 241: 1, 2161: 1, 9091: 1}
+    1000000000000002 {2: 1, 3: 1, 166666666666667: 1}
+
+    >>> lo, offsets, primes, exponents = next(factorint_range(12, 16, packed=True))
+    >>> offsets.tolist(), primes.tolist(), exponents.tolist()
+    ([0, 2, 3, 5, 7], [2, 3, 13, 2, 7, 3, 5], [2, 1, 1, 1, 1, 1, 1])
+
+    See Also
+    ========
+
+    FactorSieve.factorint_many
+
+    """
+    a, b = as_int(a), as_int(b)
+    if a < 1:
+        raise ValueError("a must be a positive integer")
+    if chunk_size is None:
+        chunk_size = _SEGMENT_SIZE
+    chunk_size = as_int(chunk_size)
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+    if use_numpy is None:
+        use_numpy = numpy is not None and b <= 1 << 63
+    elif use_numpy and numpy is None:
+        raise ImportError("NumPy is not installed")
+    if b <= a:
+        return
+    if use_numpy:
+        primes = _odd_primes(isqrt(b - 1), True)
+        primes = numpy.concatenate(([2], primes))
+        nxt = -a % primes
+        for lo in range(a, b, chunk_size):
+            hi = min(lo + chunk_size, b)
+            offsets, ps, es = _window_factors(lo, hi, primes, nxt, a)
+            if packed:
+                yield lo, offsets, ps, es
+                continue
+            offsets, ps, es = offsets.tolist(), ps.tolist(), es.tolist()
+            for i in range(hi - lo):
+                j, k = offsets[i], offsets[i + 1]
+                yield lo + i, dict(zip(ps[j:k], es[j:k]))
+        return
+    primes = [2] + _odd_primes(isqrt(b - 1))
+    # The primes above chunk_size divide at most one integer of a chunk, so
+    # each is kept in the bucket of the chunk of its next multiple.
+    small = primes[:bisect(primes, chunk_size)]
+    buckets = {}
+    for p in primes[len(small):]:
+        m = a + -a % p
+        if m < b:
+            buckets.setdefault((m - a) // chunk_size, []).append((p, m))
+    for c, lo in enumerate(range(a, b, chunk_size)):
+        hi = min(lo + chunk_size, b)
+        rest = list(range(lo, hi))
+        factors = [{} for _ in rest]
+        multiples = [(p, j) for p in small for j in range(-lo % p, hi - lo, p)]
+        for p, m in buckets.pop(c, []):
+            multiples.append((p, m - lo))
+            m += p
+            if m < b:
+                buckets.setdefault((m - a) // chunk_size, []).append((p, m))
+        for p, j in multiples:
+            m, e = rest[j] // p, 1
+            while m % p == 0:
+                m //= p
+                e += 1
+            rest[j] = m
+            factors[j][p] = e
+        for j, m in enumerate(rest):
+            if m > 1:
+                factors[j][m] = 1
+        if not packed:
+            yield from zip(range(lo, hi), (dict(sorted(f.items())) for f in factors))
+            continue
+        offsets, ps, es = _array('Q', [0]), _array('Q'), _array('B')
+        for f in factors:
+            for p in sorted(f):
+                ps.append(p)
+                es.append(f[p])
+            offsets.append(len(ps))
+        yield lo, offsets, ps, es
+
+
+def _mertens_table(x, sieve):
+    r""" Returns ``K`` and a list or a NumPy array ``big`` with
+    ``big[k]`` `= M(x/k)` for `1 \le k \le K`, where `M(v) \le L \approx x^{2/3}`
+    is read from the :class:`MobiusSieve` ``sieve`` for `v \le L` and `K = x/(L+1)`.
+
+    The values are found for decreasing ``k`` from `\sum_{d \le v} M(v/d) = 1`:
+
+    .. math ::
+        M(v) = 1 - \sum_{d=2}^{\sqrt{v}} M(v/d)
+               - \sum_{q=1}^{v/(\sqrt{v}+1)} M(q) (v/q - v/(q+1))
+
+    where `M(v/d)` is an earlier `M(x/kd)` if `kd \le K`, and is read from
+    the sieve otherwise. This takes `O(x^{2/3})` time. With NumPy, the
+    terms for each ``k`` are summed in one vectorised step.
+    """
+    L = max(isqrt(x), int(x ** (2 / 3)))
+    K = x // (L + 1)
+    sieve.extend(L + 1)
+    r = isqrt(x)
+    if not sieve._use_numpy:
+        small = list(accumulate(sieve[1:r + 1], initial=0))
+        big = [0] * (K + 1)
+        for k in range(K, 0, -1):
+            v = x // k
+            s = isqrt(v)
+            t = v // (s + 1)
+            acc = sum(big[2 * k:K + 1:k])
+            acc += sum(sieve.prefix_sum(x // (k * d)) for d in range(K // k + 1, s + 1))
+            acc += sum(small[q] * (v // q - v // (q + 1)) for q in range(1, t + 1))
+            big[k] = 1 - acc
+        return K, big
+    small = sieve._prefix_sum_array(numpy.arange(r + 1))
+    big = numpy.zeros(K + 1, dtype=numpy.int64)
+    for k in range(K, 0, -1):
+        v = x // k
+        s = isqrt(v)
+        t = v // (s + 1)
+        acc = int(big[2 * k:K + 1:k].sum())
+        acc += int(sieve._prefix_sum_array(x // (k * numpy.arange(K // k + 1, s + 1))).sum())
+        q = numpy.arange(1, t + 2)
+        acc += int((small[1:t + 1] * (v // q[:-1] - v // q[1:])).sum())
+        big[k] = 1 - acc
+    return K, big
+
+
+def mertens(x, sieve=None):
+    r""" Returns the Mertens function `M(x) = \sum_{n \le x} \mu(n)`
+
+    It uses `\sum_{d \le x} M(x/d) = 1` and takes `O(x^{2/3})` time,
+    with a :class:`MobiusSieve` up to `x^{2/3}` for the small values.
+    ``sieve`` is the :class:`MobiusSieve` to use, a new one by default.
+
+    Examples
+    ========
+
+    >>> from sympy.ntheory.sieve_ import mertens
+    >>> mertens(10**6)
+    212
+
+    See Also
+    ========
+
+    MobiusSieve.prefix_sum
+
+    References
+    ==========
+
+    .. [1] M. Deleglise and J. Rivat, Computing the summation of the Mobius
+           function, Experimental Mathematics 5 (1996), 291-295
+
+    """
+    x = as_int(x)
+    if x < 1:
+        return 0
+    if sieve is None:
+        sieve = MobiusSieve()
+    K, big = _mertens_table(x, sieve)
+    return int(big[1]) if K else sieve.prefix_sum(x)
+
+
+def totient_sum(x, sieve=None):
+    r""" Returns `\Phi(x) = \sum_{n \le x} \phi(n)`
+
+    With `T(n) = n(n+1)/2` and `u = \sqrt{x}`,
+
+    .. math ::
+        \Phi(x) = \sum_{d \le x} \mu(d) T(x/d)
+                = \sum_{d \le u} \mu(d) T(x/d)
+                  + \sum_{q=1}^{x/(u+1)} T(q) (M(x/q) - M(x/(q+1)))
+
+    and the values `M(x/q)` are those computed by :func:`mertens`, so this
+    also takes `O(x^{2/3})` time. ``sieve`` is the :class:`MobiusSieve`
+    to use, a new one by default.
+
+    Examples
+    ========
+
+    >>> from sympy.ntheory.sieve_ import totient_sum
+    >>> totient_sum(10**6)
+    303963552392
+
+    See Also
+    ========
+
+    TotientSieve.prefix_sum
+
+    """
+    x = as_int(x)
+    if x < 1:
+        return 0
+    if sieve is None:
+        sieve = MobiusSieve()
+    K, big = _mertens_table(x, sieve)
+    u = isqrt(x)
+    t = x // (u + 1)
+    if not sieve._use_numpy:
+        total = sum(mu * (x // d) * (x // d + 1) // 2 for d, mu in enumerate(sieve[1:u + 1], 1))
+        M = [int(big[q]) if q <= K else sieve.prefix_sum(x // q) for q in range(1, t + 2)]
+        return total + sum(q * (q + 1) // 2 * (M[q - 1] - M[q]) for q in range(1, t + 1))
+
+    def triangular(n):
+        # n(n+1)/2 modulo 2^64
+        n = n.astype(numpy.uint64)
+        return numpy.where(n % 2 == 0, n // 2 * (n + 1), (n + 1) // 2 * n)
+
+    # the sums are taken modulo 2^64, and Phi(x) is the value of the residue
+    # nearest to 3x^2/pi^2, as |Phi(x) - 3x^2/pi^2| = O(x log x) is far below 2^63
+    d = numpy.arange(1, u + 1)
+    residue = int((sieve[1:u + 1].astype(numpy.uint64) * triangular(x // d)).sum())
+    q = numpy.arange(1, t + 2)
+    M = sieve._prefix_sum_array(x // numpy.maximum(q, K + 1))
+    M[:K] = big[1:t + 2]
+    residue += int((triangular(q[:-1]) * (M[:-1] - M[1:]).astype(numpy.uint64)).sum())
+    residue &= (1 << 64) - 1
+    estimate = int(3 * x * x / pi**2)
+    return residue + ((estimate - residue + (1 << 63)) >> 64 << 64)
@@ -1,27 +1,249 @@
-from sympy.ntheory.sieve_ import FactorSieve, TotientSieve, MobiusSieve
-from sympy.ntheory.factor_ import factorint, totient
+from multiprocessing import Pool
+import os
+import subprocess
+import sys
+import tempfile
+
+from sympy.ntheory.sieve_ import (FactorSieve, CompactFactorSieve, TotientSieve, MobiusSieve,
+                                 MultiplicativeSieve, factorint_range, mertens, totient_sum)
+from sympy.ntheory.factor_ import (factorint, totient, divisor_sigma, divisor_count,
+                                   primenu, primeomega)
 from sympy.ntheory.residue_ntheory import mobius
+from sympy.testing.pytest import raises
 
 
 def test_factorsieve():
-    fs = FactorSieve(51)
-    for n in range(2, 100):
-        f = factorint(n)
-        ff = sorted(f.keys())
-        assert fs[n] == ff[0]
-        assert fs.factorint(n) == f
-    fs.reset()
-    fs.extend(10)
+    for use_numpy in [False, None]:
+        fs = FactorSieve(51, use_numpy=use_numpy)
+        for n in range(2, 100):
+            f = factorint(n)
+            ff = sorted(f.keys())
+            assert fs[n] == ff[0]
+            assert fs.factorint(n) == f
+        fs.reset()
+        fs.extend(10)
 
 
 
 def test_totientsieve():
-    ts = TotientSieve(51)
-    for n in range(1, 100):
-        assert ts[n] == totient(n)
+    for use_numpy in [False, None]:
+        ts = TotientSieve(51, use_numpy=use_numpy)
+        for n in range(1, 100):
+            assert ts[n] == totient(n)
 
 
 def test_mobiussieve():
-    ms = MobiusSieve(51)
-    for n in range(1, 100):
-        assert ms[n] == mobius(n)
+    for use_numpy in [False, None]:
+        ms = MobiusSieve(51, use_numpy=use_numpy)
+        for n in range(1, 100):
+            assert ms[n] == mobius(n)
+
+
+def test_sieve_extend():
+    # grow in steps across several segments
+    for use_numpy in [False, None]:
+        fs = FactorSieve(use_numpy=use_numpy)
+        ts = TotientSieve(use_numpy=use_numpy)
+        ms = MobiusSieve(use_numpy=use_numpy)
+        for n in [100, 101, 5000, 300001]:
+            fs.extend(n)
+            ts.extend(n)
+            ms.extend(n)
+        for n in list(range(3, 300001, 997)) + [131071, 262147, 299993]:
+            assert fs[n] == min(factorint(n))
+            assert ts[n] == totient(n)
+            assert ms[n] == mobius(n)
+
+
+def test_compactfactorsieve():
+    for use_numpy in [False, None]:
+        cs = CompactFactorSieve(51, use_numpy=use_numpy)
+        fs = FactorSieve(use_numpy=use_numpy)
+        for n in list(range(1, 3000)) + [300007, 300017 * 7, 1009 * 1013]:
+            assert cs[n] == fs[n]
+        assert cs.factorint(2**3 * 3 * 5**2 * 7 * 1009) == {2: 3, 3: 1, 5: 2, 7: 1, 1009: 1}
+        cs.reset()
+        cs.extend(10**6)
+        assert cs[999983] == 999983
+
+
+def test_sieve_save_open():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'sieve')
+        for cls in [FactorSieve, CompactFactorSieve, TotientSieve, MobiusSieve]:
+            expected = cls(1000, use_numpy=False)
+            expected = [expected[n] for n in range(1, 3000)]
+            for save_numpy in [False, None]:
+                cls(1000, use_numpy=save_numpy).save(path)
+                for use_numpy in [False, None]:
+                    for mmap in [True, False]:
+                        sieve = cls.open(path, mmap=mmap, use_numpy=use_numpy)
+                        assert [sieve[n] for n in range(1, 3000)] == expected
+                        del sieve
+        raises(ValueError, lambda: FactorSieve.open(path))
+        with open(path, 'wb') as f:
+            f.write(b'not a sieve')
+        raises(ValueError, lambda: MobiusSieve.open(path))
+
+
+def _attached_factorint(args):
+    name, n = args
+    return FactorSieve.attach(name).factorint(n)
+
+
+def test_sieve_share_attach():
+    for use_numpy in [False, None]:
+        for cls in [FactorSieve, CompactFactorSieve, TotientSieve, MobiusSieve]:
+            sieve = cls(1000, use_numpy=use_numpy)
+            shm = sieve.share()
+            try:
+                attached = cls.attach(shm.name, use_numpy=use_numpy)
+                assert list(attached[1:1000]) == list(sieve[1:1000])
+                assert attached[2003] == sieve[2003]
+                del attached
+                other = FactorSieve if cls is not FactorSieve else TotientSieve
+                raises(ValueError, lambda: other.attach(shm.name))
+            finally:
+                shm.close()
+                shm.unlink()
+
+    # a process that attaches and exits first leaves the shared memory alone
+    sieve = FactorSieve(10**4)
+    shm = sieve.share()
+    try:
+        code = "import sys; from %s import FactorSieve; print(FactorSieve.attach(sys.argv[1])[9991])" \
+            % FactorSieve.__module__
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        out = subprocess.run([sys.executable, '-c', code, shm.name], env=env,
+                             capture_output=True, text=True, check=True)
+        assert out.stdout.strip() == '97' and 'leaked' not in out.stderr
+        attached = FactorSieve.attach(shm.name)
+        assert list(attached[1:10**4]) == list(sieve[1:10**4])
+        del attached
+    finally:
+        shm.close()
+        shm.unlink()
+
+    shm = FactorSieve(10**4).share()
+    try:
+        with Pool(2) as pool:
+            ns = [9991, 2**5 * 3**3, 9973, 10**4 - 1]
+            assert pool.map(_attached_factorint, [(shm.name, n) for n in ns]) == \
+                [FactorSieve().factorint(n) for n in ns]
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_sieve_stats():
+    for use_numpy in [False, None]:
+        for cls in [FactorSieve, CompactFactorSieve, TotientSieve, MobiusSieve]:
+            sieve = cls(100, use_numpy=use_numpy)
+            stats = sieve.stats()
+            assert (stats['hits'], stats['auto_extends'], stats['extends']) == (0, 0, 1)
+            assert stats['bound'] >= 100 and stats['nbytes'] > 0
+            sieve[77]
+            sieve[1001]
+            sieve[1:2000]
+            stats = sieve.stats()
+            assert (stats['hits'], stats['auto_extends'], stats['extends']) == (1, 2, 3)
+            assert stats['bound'] >= 2000 and stats['extend_time'] >= stats['max_extend_time'] > 0
+            sieve[1:1000]
+            if cls in (FactorSieve, CompactFactorSieve):
+                sieve.factorint_many([12, 1999])
+            else:
+                sieve.prefix_sum(1999)
+            stats = sieve.stats()
+            assert (stats['hits'], stats['auto_extends'], stats['extends']) == (3, 2, 3)
+
+            sieve.auto_extend = False
+            raises(ValueError, lambda: sieve[10**4 + 1])
+            raises(ValueError, lambda: sieve[1:10**4])
+            sieve.extend(10**4)
+            assert sieve[9997] == cls(use_numpy=use_numpy)[9997]
+
+            sieve.max_size = 2 * 10**4
+            raises(ValueError, lambda: sieve.extend(3 * 10**4))
+            sieve.extend(2 * 10**4)
+            assert sieve.stats()['auto_extends'] == 2
+
+
+def test_sieve_ranges():
+    for use_numpy in [False, None]:
+        for cls in [FactorSieve, CompactFactorSieve, TotientSieve, MobiusSieve]:
+            sieve = cls(use_numpy=use_numpy)
+            values = list(sieve[1:1000])
+            assert values == [sieve[n] for n in range(1, 1000)]
+            assert list(sieve[4:701:7]) == values[3:700:7]
+            assert list(sieve[10:10]) == []
+            raises(ValueError, lambda: sieve[0:10])
+            raises(ValueError, lambda: sieve[5:])
+
+        ts = TotientSieve(use_numpy=use_numpy)
+        ms = MobiusSieve(use_numpy=use_numpy)
+        Phi = M = 0
+        for x in range(1, 300):
+            Phi += ts[x]
+            M += ms[x]
+            assert ts.prefix_sum(x) == Phi
+            assert ms.prefix_sum(x) == M
+        assert ts.prefix_sum(0) == ms.prefix_sum(0) == 0
+        assert ms.prefix_sum(10**4) == -23
+
+        fs = FactorSieve(use_numpy=use_numpy)
+        ns = [0, 1, -12, 97, 2**10 * 3**4 * 11, 9991]
+        assert fs.factorint_many(ns) == [fs.factorint(n) for n in ns]
+        assert CompactFactorSieve(use_numpy=use_numpy).factorint_many(ns) == [fs.factorint(n) for n in ns]
+
+
+def test_mertens_totient_sum():
+    for use_numpy in [False, None]:
+        ts = TotientSieve(use_numpy=use_numpy)
+        ms = MobiusSieve(use_numpy=use_numpy)
+        for x in list(range(-1, 300)) + [12345, 10**6 + 1]:
+            assert mertens(x, MobiusSieve(use_numpy=use_numpy)) == ms.prefix_sum(max(x, 0))
+            assert totient_sum(x, MobiusSieve(use_numpy=use_numpy)) == ts.prefix_sum(max(x, 0))
+    assert mertens(10**9) == -222
+    assert totient_sum(10**9) == 303963551173008414
+
+
+def test_factorint_range():
+    fs = FactorSieve()
+    for use_numpy in [False, None]:
+        for chunk_size in [None, 7, 1000]:
+            assert list(factorint_range(1, 3000, chunk_size=chunk_size, use_numpy=use_numpy)) == \
+                [(n, fs.factorint(n)) for n in range(1, 3000)]
+        for a in [10**12 - 100, 2**40]:
+            assert list(factorint_range(a, a + 200, chunk_size=64, use_numpy=use_numpy)) == \
+                [(n, factorint(n)) for n in range(a, a + 200)]
+        lo, offsets, primes, exponents = next(factorint_range(10**15, 10**15 + 10, packed=True,
+                                                              use_numpy=use_numpy))
+        assert lo == 10**15
+        for i in range(10):
+            j, k = offsets[i], offsets[i + 1]
+            assert dict(zip(primes[j:k], exponents[j:k])) == factorint(lo + i)
+        assert list(factorint_range(5, 5, use_numpy=use_numpy)) == []
+        raises(ValueError, lambda: next(factorint_range(0, 10, use_numpy=use_numpy)))
+        raises(ValueError, lambda: next(factorint_range(1, 10, chunk_size=0, use_numpy=use_numpy)))
+
+
+def test_multiplicativesieve():
+    M = MultiplicativeSieve
+    for use_numpy in [False, None]:
+        sieves = [M.divisor_sigma(2, 100, use_numpy=use_numpy), M.divisor_count(use_numpy=use_numpy),
+                  M.primenu(use_numpy=use_numpy), M.primeomega(use_numpy=use_numpy),
+                  M.liouville(use_numpy=use_numpy), M.mobius(use_numpy=use_numpy),
+                  M.totient(use_numpy=use_numpy)]
+        for n in [1, 2, 3, 17, 64, 97, 120, 121, 999, 1001, 1024, 5040]:
+            assert [sieve[n] for sieve in sieves] == [divisor_sigma(n, 2), divisor_count(n), primenu(n),
+                                                      primeomega(n), (-1)**primeomega(n), mobius(n), totient(n)]
+        sigma = M(lambda p, e: (p**(e + 1) - 1) // (p - 1), use_numpy=use_numpy)
+        assert sigma[1:21].tolist() == [divisor_sigma(n) for n in range(1, 21)]
+        sigma.extend(3000)
+        assert sigma[2000:3000].tolist() == [divisor_sigma(n) for n in range(2000, 3000)]
+        raises(ValueError, lambda: sigma[0])
+        assert sigma[:7].tolist() == [1, 3, 4, 7, 6, 12]
+        assert sigma[:12:5].tolist() == [1, 12, 12]
+        raises(ValueError, lambda: sigma[0:5])
+        raises(ValueError, lambda: sigma[1:])
+        raises(OverflowError, lambda: M(lambda p, e: p**64, 10, use_numpy=use_numpy))
@@ -1,5 +1,13 @@
-from algebraic_ntheory import class_number_of_quadratic_field, QuadraticFormClassGroup, _class_number_neg_naive
+import algebraic_ntheory
+from algebraic_ntheory import (class_number_of_quadratic_field, class_numbers_range,
+                               class_numbers_of_quadratic_fields,
+                               QuadraticFormClassGroup, FormPowers, KroneckerTableCache,
+                               _class_number_neg_naive, _class_number_pos, _regulator)
 
+import math
+from math import isqrt
+from gmpy2 import kronecker
+from sympy.solvers.diophantine.diophantine import diop_DN
 import pytest
 
 def test_quadratic_form_class_group_reduce():
@@ -34,6 +42,63 @@ def test_quadratic_form_class_group_n_times():
     assert qf.n_times(3, 1, 7, 2) == (3, -1, 7)
     assert qf.n_times(3, 1, 7, 3) == (1, 1, 21)
 
+def test_quadratic_form_class_group_nucomp():
+    for disc in list(range(3, 2000, 4)) + list(range(4, 2000, 4)) + [2**127 - 1, 2**255 + 3]:
+        qf = QuadraticFormClassGroup(-disc)
+        qn = QuadraticFormClassGroup(-disc, nucomp=True)
+        forms = qf._prime_forms()
+        fs = [next(forms) for _ in range(3)]
+        for f1 in fs:
+            assert qn.composition_double(*f1) == qf.composition_double(*f1)
+            assert qn.n_times(*f1, 1000) == qf.n_times(*f1, 1000)
+            for f2 in fs:
+                assert qn.composition(*f1, *f2) == qf.composition(*f1, *f2)
+    qn = QuadraticFormClassGroup(-44, nucomp=True)
+    assert qn.composition(3, 2, 4, 3, 2, 4) == (3, -2, 4)
+    assert qn.counting_order() == 3
+
+def test_form_powers():
+    qf = QuadraticFormClassGroup(-83) # Z_3
+    powers = FormPowers(qf, 3, 1, 7)
+    assert powers.pow(0) == (1, 1, 21)
+    assert powers.pow(2) == (3, -1, 7)
+    assert powers.pow(-1) == (3, -1, 7)
+    assert powers.pow(3) == (1, 1, 21)
+
+    disc = -(2**127 - 1)
+    base = QuadraticFormClassGroup(disc)
+    f = next(base._prime_forms())
+    def binary_pow(n):
+        # 表を使わない2進法
+        result, g = base.identity(), f
+        while n:
+            if n % 2:
+                result = base.composition(*result, *g)
+            g = base.composition(*g, *g)
+            n >>= 1
+        return result
+    for window in [2, 3, 5]:
+        qf = QuadraticFormClassGroup(disc, window=window, cache_size=2)
+        for n in [1, 2, 3, 7, 8, 1000, 2**64 - 1, 3**40]:
+            expected = binary_pow(n)
+            assert qf.n_times(*f, n) == expected
+            assert FormPowers(qf, *f, window, max_bits=3).pow(n) == expected
+        for g in qf._prime_forms():
+            qf.n_times(*g, 5)
+            if 5 < g[0]:
+                break
+        assert len(qf._powers) == 2
+    qf = QuadraticFormClassGroup(disc, cache_size=0)
+    for n in [0, 1, 1000, 3**40]:
+        a, b, c = binary_pow(n)
+        assert qf.n_times(*f, n) == (a, b, c)
+        assert qf.n_times(*f, -n) == base.reduction(a, -b, c)
+    assert not qf._powers
+    with pytest.raises(ValueError):
+        QuadraticFormClassGroup(disc, window=1)
+    with pytest.raises(ValueError):
+        FormPowers(base, *f, window=1)
+
 def test_quadratic_form_class_group_counting_naive():
     assert QuadraticFormClassGroup(-3).counting_naive() == 1
     assert QuadraticFormClassGroup(-4).counting_naive() == 1
@@ -56,6 +121,30 @@ def test_quadratic_form_class_group_counting_naive():
         assert QuadraticFormClassGroup(disc).counting_naive() == h
         disc -= 4
 
+def test_quadratic_form_class_group_enumerate_elements(monkeypatch):
+    def naive(disc):
+        forms = []
+        for a in range(1, isqrt(-disc // 3) + 1):
+            for b in range(-a + 1, a + 1):
+                if (b**2 - disc) % (4 * a):
+                    continue
+                c = (b**2 - disc) // (4 * a)
+                if a <= c and (0 <= b or a != c) and math.gcd(a, b, c) == 1:
+                    forms.append((a, b, c))
+        return forms
+
+    assert QuadraticFormClassGroup(-20).enumerate_elements() == [(1, 0, 5), (2, 2, 3)]
+    forms = QuadraticFormClassGroup(-20).enumerate_elements(as_array=True)
+    assert forms.dtype == 'int64' and forms.tolist() == [[1, 0, 5], [2, 2, 3]]
+    for disc in list(range(3, 1500, 4)) + list(range(4, 1500, 4)) + [4 * 3 * 5 * 7 * 11, 9 * 27 * 7 * 4]:
+        assert QuadraticFormClassGroup(-disc).enumerate_elements() == naive(-disc)
+    # numpy を使わない場合も同じ型と順序
+    monkeypatch.setattr(algebraic_ntheory, 'numpy', None)
+    for disc in [3, 20, 4 * 3 * 5 * 7 * 11, 9 * 27 * 7 * 4]:
+        assert QuadraticFormClassGroup(-disc).enumerate_elements() == naive(-disc)
+    with pytest.raises(ValueError):
+        QuadraticFormClassGroup(-20).enumerate_elements(as_array=True)
+
 def test_quadratic_form_class_group_counting_order():
     for disc in range(3, 1000, 4):
         qf = QuadraticFormClassGroup(-disc)
@@ -65,7 +154,86 @@ def test_quadratic_form_class_group_counting_order():
         qf = QuadraticFormClassGroup(-disc)
         assert qf.counting_order() == qf.counting_naive()
 
-@pytest.mark.skipif(True, reason="slow")
+    # non-cyclic class groups and larger discriminants
+    for disc in [3299, 4 * 3 * 5 * 7 * 11 * 13 * 17, 10**7 + 3, 10**7 + 4]:
+        qf = QuadraticFormClassGroup(-disc)
+        assert qf.counting_order() == qf.counting_naive()
+
+def test_quadratic_form_class_group_structure():
+    assert QuadraticFormClassGroup(-3).structure() == []
+    assert QuadraticFormClassGroup(-23).structure() == [3]
+    assert QuadraticFormClassGroup(-420).structure() == [2, 2, 2]
+    assert QuadraticFormClassGroup(-3299).structure() == [3, 9]
+    assert QuadraticFormClassGroup(-4 * 3 * 5 * 7 * 11 * 13 * 17).structure() == [2, 2, 2, 2, 16]
+    for disc in range(3, 2000, 4):
+        qf = QuadraticFormClassGroup(-disc)
+        assert math.prod(qf.structure()) == qf.counting_naive()
+
+def test_kronecker_table_cache():
+    cache = KroneckerTableCache(limit=200)
+    for disc in [-3, -4, -8, -20, -23, -27, -144, -199, 5, 8, 12, 60, 189]:
+        assert list(cache[disc]) == [kronecker(disc, n) for n in range(abs(disc))]
+    assert cache[-203] is None
+    assert sum(t.nbytes for t in cache._tables.values()) <= 200
+    cache.clear()
+    assert not cache._tables
+    # 複数の区間に分けて作る場合
+    cache = KroneckerTableCache(limit=1 << 12)
+    cache._SEGMENT = 7
+    for disc in [-3, -23, -1000, -3299, 1129, 4 * 1001]:
+        assert list(cache[disc]) == [kronecker(disc, n) for n in range(abs(disc))]
+    with pytest.raises(ValueError):
+        KroneckerTableCache(limit=1 << 32)
+
+def test_class_number_cached_table(monkeypatch):
+    # 表がキャッシュにあれば、|D| > 1000 でも類数公式を用いる
+    disc = -100003
+    h = QuadraticFormClassGroup(disc).counting_order()
+    monkeypatch.setattr(algebraic_ntheory, 'kronecker_tables', KroneckerTableCache())
+    algebraic_ntheory.kronecker_tables[disc]
+    def fail(self):
+        raise AssertionError
+    monkeypatch.setattr(QuadraticFormClassGroup, 'counting_order', fail)
+    assert class_number_of_quadratic_field(disc=disc) == h
+    with pytest.raises(AssertionError):
+        class_number_of_quadratic_field(disc=disc - 4)
+
+def test_class_number_naive():
+    for disc, h in class_numbers_range(-3000, -5):
+        d = -disc if disc % 4 else -disc // 4
+        if disc % 16 in (0, 4) or any(d % (p * p) == 0 for p in range(3, isqrt(d) + 1, 2)):
+            continue
+        assert _class_number_neg_naive(disc) == h
+    assert [_class_number_pos(disc) for disc in [5, 40, 229, 328, 401, 1129]] == [1, 2, 3, 4, 5, 9]
+
+def test_class_numbers_of_quadratic_fields():
+    discs = [-23, 229, -3299, 5, -4, 30_001, -(10**12 + 3), -420, 8, -1003]
+    expected = [(disc, class_number_of_quadratic_field(disc=disc)) for disc in discs]
+    assert list(class_numbers_of_quadratic_fields(discs, processes=1)) == expected
+    assert list(class_numbers_of_quadratic_fields(discs, processes=2)) == expected
+    assert sorted(class_numbers_of_quadratic_fields(discs, processes=3, ordered=False)) == sorted(expected)
+    assert list(class_numbers_of_quadratic_fields([], processes=2)) == []
+    with pytest.raises(ValueError):
+        next(class_numbers_of_quadratic_fields([-3, 0]))
+
+def test_class_numbers_range():
+    assert list(class_numbers_range(-24, -3)) == [(-3, 1), (-4, 1), (-7, 1), (-8, 1), (-11, 1), (-12, 1),
+                                                  (-15, 2), (-16, 1), (-19, 1), (-20, 2), (-23, 3), (-24, 2)]
+    for disc, h in class_numbers_range(-3000, -1000, block=100):
+        assert QuadraticFormClassGroup(disc).counting_naive() == h
+    assert list(class_numbers_range(-4, -4)) == [(-4, 1)]
+    assert list(class_numbers_range(-6, -5)) == []
+    with pytest.raises(ValueError):
+        next(class_numbers_range(-3, -4))
+    with pytest.raises(ValueError):
+        next(class_numbers_range(-3, 0))
+
+def test_regulator():
+    for disc in [5, 8, 12, 13, 21, 28, 41, 61, 92, 109, 409, 1996]:
+        x, y = min((x, y) for x, y in diop_DN(disc, 4) + diop_DN(disc, -4) if 0 < y and 0 < x)
+        R, _ = _regulator(disc)
+        assert math.isclose(R, math.log((x + y * math.sqrt(disc)) / 2), rel_tol=1e-12)
+
 def test_class_number_of_quadratic_field():
     # imaginary
     ds = [1, 2, 3, 7, 11, 19, 43, 67, 163] # A003173
@@ -116,3 +284,13 @@ def test_class_number_of_quadratic_field():
     for h, ds in ds_list:
         assert all(class_number_of_quadratic_field(d=d) == h for d in ds)
 
+    # real, beyond the old limit of 30000
+    # hR = -1/2 \sum_{a=1}^{D-1} (D/a) \log \sin(\pi a / D)
+    for disc in [30_001, 30_005, 100_049, 120_008, 120_044]:
+        R, _ = _regulator(disc)
+        hR = -math.fsum(kronecker(disc, a) * math.log(math.sin(math.pi * a / disc))
+                        for a in range(1, disc)) / 2
+        assert class_number_of_quadratic_field(disc=disc) == round(hR / R)
+
+    # real, non-fundamental discriminants (class number of the order)
+    assert [class_number_of_quadratic_field(disc=disc) for disc in [32, 45, 80, 96, 288, 1008]] == [1, 1, 1, 2, 2, 2]
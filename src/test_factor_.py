@@ -0,0 +1,180 @@
+from math import lcm
+
+from time import monotonic
+
+from sympy.ntheory.factor_ import (pollard_pm1, _pm1_exponent, _pm1_stage2, _primes_in_segments,
+                                   _stage2_D, _stage2_pairs, lenstra_ecm, _ecm_curve, _mont_add,
+                                   _mont_double, _mont_ladder, _suyama, pollard_rho_brent_variation,
+                                   pollard_rho_brent_parallel, pollard_rho_brent_batch)
+from sympy.ntheory.generate import nextprime, primerange
+from sympy.testing.pytest import raises
+
+
+def test_pm1_exponent():
+    for B in [1, 2, 3, 10, 64, 100, 1000, 1009]:
+        assert _pm1_exponent(B) == _pm1_exponent.__wrapped__(B) == lcm(*range(1, B + 1))
+    _pm1_exponent.cache_clear()
+    _pm1_exponent(100)
+    _pm1_exponent(100)
+    _pm1_exponent(1000)
+    info = _pm1_exponent.cache_info()
+    assert (info.hits, info.misses) == (1, 2)
+    pollard_pm1(607 * 20521043, B=100)
+    assert _pm1_exponent.cache_info().hits == 2
+
+
+def test_primes_in_segments():
+    assert list(_primes_in_segments(1, 100, segment=7)) == list(primerange(100))
+    assert list(_primes_in_segments(10**4, 10**5, segment=1000)) == list(primerange(10**4, 10**5))
+    assert list(_primes_in_segments(24, 29)) == []
+
+
+def test_pm1_stage2():
+    # D: the primes of D are at most B, and D**2 <= B2 - B
+    assert _stage2_D(3, 10**6) == 6
+    assert _stage2_D(5, 10**6) == 30
+    assert _stage2_D(100, 200) == 6
+    assert _stage2_D(10**4, 10**6) == 210
+    assert _stage2_D(10**4, 10**7) == 2310
+    assert _stage2_D(20, 10**8) == 2310
+
+    # the pairs 11, 13 and 17, 19 and 29, 31 share a j
+    assert list(_stage2_pairs(10, 40, 6)) == [(2, {1}), (3, {1}), (4, {1}), (5, {1}), (6, {1})]
+    for B, B2 in [(5, 1000), (100, 10**4), (1000, 10**5)]:
+        D = _stage2_D(B, B2)
+        covered = set()
+        for k, js in _stage2_pairs(B, B2, D):
+            assert all(0 < 2 * j < D for j in js)
+            covered.update(q for j in js for q in [k * D - j, k * D + j])
+        assert covered.issuperset(primerange(B + 1, B2 + 1))
+
+    # r - 1 = 2 * 1009 * 10169 is not found with B = 100, B2 = 10**4
+    r = 20521043
+    # p - 1 = m * q with m 100-smooth and q in (100, 10**4]: q = 101 (unpaired),
+    # 109 and 131 (a pair with D = 30) and 9973
+    for p in [607, 1091, 263, 119677]:
+        assert pollard_pm1(p * r, B=100) is None
+        assert pollard_pm1(p * r, B=100, B2=100) is None
+        assert pollard_pm1(p * r, B=100, B2=10**4) == p
+        assert _pm1_stage2(pow(2, 2**7 * 3**5 * 5**3 * 7**3, p * r), p * r, 100, 10**4) % p == 0
+    # D = 30 > B = 5, so that the prime q = 7 of p - 1 = 42 lies in the block k = 0
+    assert pollard_pm1(43 * r, B=5) is None
+    assert pollard_pm1(43 * r, B=5, B2=1000) == 43
+    raises(ValueError, lambda: pollard_pm1(43 * r, B=2))
+
+
+def _affine_multiples(x, y, A, B, p, k):
+    """ x(P), ..., x(kP) of P = (x, y) on By^2 = x^3 + Ax^2 + x over GF(p),
+    with None for the identity, by affine additions """
+    xs, Q = [], None
+    for _ in range(k):
+        if Q is None:
+            Q = (x, y)
+        elif Q[0] == x:
+            if (Q[1] + y) % p == 0:
+                Q = None
+            else:
+                l = (3 * x * x + 2 * A * x + 1) * pow(2 * B * y, -1, p) % p
+                x3 = (B * l * l - A - 2 * x) % p
+                Q = (x3, (l * (x - x3) - y) % p)
+        else:
+            l = (Q[1] - y) * pow(Q[0] - x, -1, p) % p
+            x3 = (B * l * l - A - x - Q[0]) % p
+            Q = (x3, (l * (x - x3) - y) % p)
+        xs.append(None if Q is None else Q[0])
+    return xs
+
+
+def test_montgomery_curve():
+    for p in [1009, 10007]:
+        for sigma in [6, 7, 100]:
+            X, Z, a24 = _suyama(p, sigma)
+            A = (4 * a24 - 2) % p
+            x = X * pow(Z, -1, p) % p
+            # the starting point is (x, 1) on By^2 = x^3 + Ax^2 + x
+            B = (x**3 + A * x * x + x) % p
+            xs = _affine_multiples(x, 1, A, B, p, 60)
+            for k, xk in enumerate(xs, 1):
+                Xk, Zk = _mont_ladder(k, X, Z, a24, p)
+                if xk is None:
+                    assert Zk % p == 0
+                else:
+                    assert Xk * pow(Zk, -1, p) % p == xk
+            # x(kP) = x((k - 1)P + P) with the difference (k - 2)P
+            for k in range(3, 60):
+                if None not in xs[k - 3:k]:
+                    Xk, Zk = _mont_add(xs[k - 2], 1, x, 1, xs[k - 3], 1, p)
+                    assert Xk * pow(Zk, -1, p) % p == xs[k - 1]
+            Xd, Zd = _mont_double(x, 1, a24, p)
+            assert Xd * pow(Zd, -1, p) % p == xs[1]
+            # Suyama's curves have an order divisible by 12 (Euler's criterion for the points)
+            order = p + 1 + sum((pow(B * (t**3 + A * t * t + t), (p - 1) // 2, p) + 1) % p - 1
+                                for t in range(p))
+            assert order % 12 == 0
+    assert _suyama(10007 * 1009, 1009)[1:] == (None, None)
+
+
+def test_lenstra_ecm():
+    r = nextprime(10**15)
+    p = 10007
+    # the curve sigma = 6 finds p in stage 1
+    assert _ecm_curve(p * r, 6, 100, 100) == p
+    # the point of sigma = 8 has order 409 modulo p after stage 1
+    assert _ecm_curve(p * r, 8, 100, 100) == 1
+    assert _ecm_curve(p * r, 8, 100, 1000) == p
+    # with D = 210 > B1, the first block of the giant steps is k = 0
+    assert _ecm_curve(p * r, 8, 100, 50000) == p
+    assert lenstra_ecm(p * r, B1=100) == p
+    assert lenstra_ecm(1000000000000037 * 100000000000000000039, B1=2000) == 1000000000000037
+
+    assert lenstra_ecm(p, B1=100, max_curves=10) is None
+    assert lenstra_ecm(p**2, B1=100) == p
+    assert lenstra_ecm(p**3, B1=100) in [p, p**2]
+    assert lenstra_ecm(2 * r) == 2
+    raises(ValueError, lambda: lenstra_ecm(6))
+    # the modulus D = 6 of stage 2 needs B1 >= 3
+    raises(ValueError, lambda: lenstra_ecm(10007 * 1000003, B1=1))
+    raises(ValueError, lambda: lenstra_ecm(10007 * 1000003, B1=2))
+    assert lenstra_ecm(10007 * 1000003, B1=3) in [10007, 1000003]
+
+
+def test_pollard_rho_brent_parallel():
+    for processes in [1, 2]:
+        for tries in [None, 1, 5]:
+            g = pollard_rho_brent_parallel(1000003 * 1000033, tries=tries, processes=processes)
+            assert g in [1000003, 1000033]
+        assert pollard_rho_brent_parallel(1099564581221, processes=processes) in [524309, 2097169]
+        assert pollard_rho_brent_parallel(10007, processes=processes) is None
+        assert pollard_rho_brent_parallel(6, processes=processes) in [2, 3, None]
+        # too few steps for the factors of about 10**30
+        n = nextprime(10**30) * nextprime(10**31)
+        assert pollard_rho_brent_parallel(n, tries=4, processes=processes, max_steps=1000) is None
+        start = monotonic()
+        assert pollard_rho_brent_parallel(n, tries=4, processes=processes, timeout=0.5) is None
+        assert monotonic() - start < 30
+    assert pollard_rho_brent_parallel(1099564581221, processes=1) == \
+        pollard_rho_brent_parallel(1099564581221, tries=1, processes=1)
+    raises(ValueError, lambda: pollard_rho_brent_parallel(4))
+    assert pollard_rho_brent_variation(10007) is None
+
+
+def test_pollard_rho_brent_batch():
+    ns = [1099564581221, 1000003 * 1000033, 999983 * 1000003,
+          # primes
+          5, 10007, 2**31 - 1, 2**61 - 1,
+          # perfect squares
+          9, 10007**2, 1000003**2, 3037000493**2,
+          # near 2**63
+          2**63 - 25, 2**63 - 1, 99991 * 92242022150539, 3 * 3074457345618258599]
+    for max_steps in [10, 3000]:
+        assert pollard_rho_brent_batch(ns, max_steps=max_steps) == \
+            [pollard_rho_brent_variation(n, max_steps=max_steps) for n in ns]
+        assert pollard_rho_brent_batch(ns, s=7, a=3, max_steps=max_steps) == \
+            [pollard_rho_brent_variation(n, s=7, a=3, max_steps=max_steps) for n in ns]
+    assert pollard_rho_brent_batch([6, 10007 * 2, 2**62, 10007 * 10009]) == [2, 2, 2, 10007]
+    # 7**2 and 23**2 restart from the saved value with Python integers
+    result = pollard_rho_brent_batch([49, 529, 1099564581221])
+    assert result == [7, 23, 524309] and all(type(g) is int for g in result)
+    assert pollard_rho_brent_batch([]) == []
+    raises(ValueError, lambda: pollard_rho_brent_batch([4]))
+    raises(ValueError, lambda: pollard_rho_brent_batch([2**63 + 1]))